@@ -0,0 +1,285 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: intersight_bundle
+short_description: Configure a bundle of related Cisco Intersight objects in parallel
+description:
+- Configures a set of objects that reference each other (e.g., a HyperFlex Cluster Profile and its policies) in
+  L(Cisco Intersight,https://intersight.com) from a single task.
+- 'References between objects are given with C({"$ref": "<key>"}) in the I(api_body) of an object and are replaced
+  with C({"Moid": "<Moid of the referenced object>"}) when the referenced object has been configured.'
+- The references form a dependency graph.  Objects that do not depend on each other are configured concurrently and
+  each object is configured as soon as the objects it references are available.
+- Each object is configured like M(intersight_rest_api) with state C(present).  Existing objects are only updated
+  if their properties differ from the I(api_body).
+extends_documentation_fragment: intersight
+options:
+  objects:
+    description:
+    - 'List of objects to configure.  Each object has the following:'
+    - '- key: Unique key used to reference the object from other objects in the bundle.'
+    - '- resource_path: Resource URI of the object (e.g., /hyperflex/SysConfigPolicies).'
+    - '- api_body: Properties of the object.'
+    - "- query_params: Optional query parameters used to find an existing object.  Defaults to a $filter on the Name in the api_body."
+    - '- update_method: Optional HTTP method used for updates (patch or post).  Defaults to patch.'
+    type: list
+    required: yes
+  max_workers:
+    description:
+    - Maximum number of objects configured concurrently.
+    type: int
+    default: 10
+author:
+- David Soper (@dsoper2)
+- CiscoUcs (@CiscoUcs)
+version_added: '2.8'
+'''
+
+EXAMPLES = r'''
+- name: Configure a HyperFlex Cluster Profile and its policies
+  intersight_bundle:
+    api_private_key: "{{ api_private_key }}"
+    api_key_id: "{{ api_key_id }}"
+    objects:
+      - key: sys_config
+        resource_path: /hyperflex/SysConfigPolicies
+        api_body: {
+          "Name": "devnet-dns-ntp",
+          "Timezone": "America/Los_Angeles",
+          "DnsServers": ["171.70.168.183"],
+          "NtpServers": ["ntp.esl.cisco.com"]
+        }
+      - key: vcenter
+        resource_path: /hyperflex/VcenterConfigPolicies
+        api_body: {
+          "Name": "devnet-vcenter",
+          "Hostname": "172.28.225.220",
+          "Username": "administrator@vsphere.local",
+          "Password": "{{ hx_vcenter_password }}",
+          "DataCenter": "SJC07"
+        }
+      - key: storage
+        resource_path: /hyperflex/ClusterStoragePolicies
+        api_body: {
+          "Name": "devnet-storage",
+          "DiskPartitionCleanup": true
+        }
+      - key: profile
+        resource_path: /hyperflex/ClusterProfiles
+        api_body: {
+          "Name": "{{ hx_profile_name }}",
+          "MgmtPlatform": "EDGE",
+          "SysConfig": {"$ref": "sys_config"},
+          "VcenterConfig": {"$ref": "vcenter"},
+          "ClusterStorage": {"$ref": "storage"}
+        }
+      - key: software_version
+        resource_path: /hyperflex/SoftwareVersionPolicies
+        api_body: {
+          "Name": "{{ hx_profile_name }}-software-version-policy",
+          "HxdpVersion": "3.5(2b)",
+          "ClusterProfiles": [{"$ref": "profile"}]
+        }
+  delegate_to: localhost
+'''
+
+RETURN = r'''
+objects:
+  description: Results for each object in the bundle, keyed by the object key.
+  returned: always
+  type: complex
+  contains:
+    Moid:
+      description: The Moid of the object.
+      returned: when the object exists
+      type: str
+      sample: 5978bea36ad4b000018d63dc
+    changed:
+      description: Whether the object was (or in check mode would be) created or updated.
+      returned: always
+      type: bool
+      sample: true
+    msg:
+      description: Error details if the object could not be configured.
+      returned: when the object failed
+      type: str
+'''
+
+from ansible.module_utils.remote_management.intersight import IntersightModule, intersight_argument_spec, compare_values, \
+    run_dependency_graph, start_background_job
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six import iteritems
+
+
+def get_references(value):
+    '''
+    Return the set of object keys referenced with {"$ref": key} anywhere within value
+    '''
+    refs = set()
+    if isinstance(value, dict):
+        if list(value) == ['$ref']:
+            refs.add(value['$ref'])
+        else:
+            for item in value.values():
+                refs.update(get_references(item))
+    elif isinstance(value, list):
+        for item in value:
+            refs.update(get_references(item))
+    return refs
+
+
+def resolve_references(value, moids):
+    '''
+    Return a copy of value with each {"$ref": key} replaced by {"Moid": moid}
+    '''
+    if isinstance(value, dict):
+        if list(value) == ['$ref']:
+            return {'Moid': moids[value['$ref']]}
+        return dict((key, resolve_references(item, moids)) for (key, item) in iteritems(value))
+    if isinstance(value, list):
+        return [resolve_references(item, moids) for item in value]
+    return value
+
+
+def find_cycle(dependencies):
+    '''
+    Return a list of keys that form a dependency cycle or None
+    '''
+    visiting = []
+    visited = set()
+
+    def visit(key):
+        if key in visiting:
+            return visiting[visiting.index(key):] + [key]
+        if key in visited:
+            return None
+        visiting.append(key)
+        for dep in dependencies[key]:
+            cycle = visit(dep)
+            if cycle:
+                return cycle
+        visiting.pop()
+        visited.add(key)
+        return None
+
+    for key in dependencies:
+        cycle = visit(key)
+        if cycle:
+            return cycle
+    return None
+
+
+def configure_object(intersight, item, dep_moids):
+    '''
+    GET the object and create or update it if needed, returning the Moid and changed status
+    '''
+    api_body = resolve_references(item['api_body'], dep_moids)
+    query_params = item.get('query_params') or {'$filter': "Name eq '%s'" % api_body.get('Name')}
+    options = {
+        'http_method': 'get',
+        'resource_path': item['resource_path'],
+        'query_params': query_params,
+    }
+    results = intersight.api_request(**options).get('Results')
+    moid = None
+    if results:
+        moid = results[0]['Moid']
+        if compare_values(api_body, results[0]):
+            return dict(Moid=moid, changed=False)
+    if intersight.module.check_mode:
+        return dict(Moid=moid, changed=True)
+
+    if moid:
+        options = {
+            'http_method': item.get('update_method') or 'patch',
+            'resource_path': item['resource_path'],
+            'body': api_body,
+            'moid': moid,
+        }
+        intersight.api_request(**options)
+    else:
+        options = {
+            'http_method': 'post',
+            'resource_path': item['resource_path'],
+            'body': api_body,
+        }
+        response = intersight.api_request(**options)
+        moid = response.get('Moid')
+        if not moid:
+            # POSTs may not return any data so get the current state of the object
+            options = {
+                'http_method': 'get',
+                'resource_path': item['resource_path'],
+                'query_params': query_params,
+            }
+            moid = intersight.api_request(**options)['Results'][0]['Moid']
+    return dict(Moid=moid, changed=True)
+
+
+def main():
+    argument_spec = intersight_argument_spec
+    argument_spec.update(
+        objects=dict(type='list', required=True),
+        max_workers=dict(type='int', default=10),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+    )
+
+    start_background_job(module)
+
+    intersight = IntersightModule(module)
+
+    items = {}
+    dependencies = {}
+    for item in module.params['objects']:
+        for required in ['key', 'resource_path', 'api_body']:
+            if not item.get(required):
+                module.fail_json(msg="%s is required for each object" % required)
+        if item['key'] in items:
+            module.fail_json(msg="Duplicate object key %s" % item['key'])
+        items[item['key']] = item
+        dependencies[item['key']] = sorted(get_references(item['api_body']))
+    for key, deps in iteritems(dependencies):
+        unknown = [dep for dep in deps if dep not in items]
+        if unknown:
+            module.fail_json(msg="Object %s references unknown keys: %s" % (key, ', '.join(unknown)))
+    cycle = find_cycle(dependencies)
+    if cycle:
+        module.fail_json(msg="Object references form a cycle: %s" % ' -> '.join(cycle))
+
+    def configure(key, dep_results):
+        dep_moids = dict((dep, result['Moid']) for (dep, result) in iteritems(dep_results))
+        return configure_object(intersight, items[key], dep_moids)
+
+    errors = []
+    intersight.result['objects'] = {}
+    for key, (result, error) in iteritems(run_dependency_graph(configure, dependencies, module.params['max_workers'])):
+        if error:
+            errors.append("%s: %s" % (key, str(error)))
+            result = dict(changed=False, msg=str(error))
+        intersight.result['objects'][key] = result
+        if result['changed']:
+            intersight.result['changed'] = True
+
+    if errors:
+        intersight.result['msg'] = "API error: %s " % '; '.join(sorted(errors))
+        module.fail_json(**intersight.result)
+    module.exit_json(**intersight.result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: intersight_drift_report
+short_description: Report drift of many Cisco Intersight objects from a template
+description:
+- Compares all objects of a resource (e.g., BIOS Policies) in L(Cisco Intersight,https://intersight.com) with a
+  template and reports which properties differ on which objects.
+- Objects are compared like M(intersight_rest_api) compares an I(api_body) with an existing object.
+  Password properties and properties that an object does not have are not compared.
+- The objects are fetched page by page with only the template properties selected.  Each template property is
+  collected into a column of values and each column is compared with the template value at once, using NumPy if
+  it is installed.
+extends_documentation_fragment: intersight
+options:
+  resource_path:
+    description:
+    - Resource URI of the objects to check (e.g., /bios/Policies).
+    type: str
+    required: yes
+  query_params:
+    description:
+    - Query parameters used to select the objects to check (e.g., a $filter).
+    type: dict
+  template:
+    description:
+    - Expected properties of the objects.  Nested properties are compared individually.
+    type: dict
+    required: yes
+  fail_on_drift:
+    description:
+    - If C(yes), the module fails if any object differs from the template.
+    type: bool
+    default: no
+author:
+- David Soper (@dsoper2)
+- CiscoUcs (@CiscoUcs)
+version_added: '2.8'
+requirements:
+- numpy (optional, for faster comparisons)
+'''
+
+EXAMPLES = r'''
+- name: Check all BIOS Policies against the golden settings
+  intersight_drift_report:
+    api_private_key: "{{ api_private_key }}"
+    api_key_id: "{{ api_key_id }}"
+    resource_path: /bios/Policies
+    template: {
+      "IntelHyperThreadingTech": "enabled",
+      "IntelVirtualizationTechnology": "enabled",
+      "CpuPerformance": "enterprise"
+    }
+  register: bios_drift
+- debug:
+    msg: "{{ item.key }} differs on {{ item.value.drift_count }} policies"
+  loop: "{{ bios_drift.fields | dict2items }}"
+
+- name: Fail if any NTP Policy in the Org has drifted
+  intersight_drift_report:
+    api_private_key: "{{ api_private_key }}"
+    api_key_id: "{{ api_key_id }}"
+    resource_path: /ntp/Policies
+    query_params:
+      $filter: "Organization.Moid eq '{{ org_moid }}'"
+    template: {
+      "Enabled": true,
+      "NtpServers": ["ntp.esl.cisco.com"]
+    }
+    fail_on_drift: yes
+'''
+
+RETURN = r'''
+objects_checked:
+  description: Number of objects compared with the template.
+  returned: always
+  type: int
+  sample: 1000
+drift_count:
+  description: Number of objects that differ from the template.
+  returned: always
+  type: int
+  sample: 3
+drifted_moids:
+  description: Moids of the objects that differ from the template.
+  returned: always
+  type: list
+  sample: ["5978bea36ad4b000018d63dc"]
+fields:
+  description:
+  - Drift of each template property that differs on at least one object, keyed by the dotted property path.
+  returned: always
+  type: complex
+  contains:
+    expected:
+      description: The template value.
+      returned: always
+      type: raw
+      sample: enabled
+    drift_count:
+      description: Number of objects with a different value.
+      returned: always
+      type: int
+      sample: 2
+    moids:
+      description: Moids of the objects with a different value.
+      returned: always
+      type: list
+      sample: ["5978bea36ad4b000018d63dc", "5978bea36ad4b000018d63dd"]
+'''
+
+import re
+from ansible.module_utils.remote_management.intersight import IntersightModule, intersight_argument_spec, compare_values, \
+    start_background_job
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six import iteritems
+
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# marks values not present in an object, which are not compared
+MISSING = object()
+# marks values that cannot match because a parent property is not a dict
+MISMATCH = object()
+
+
+def flatten_template(template, path=()):
+    '''
+    Return a list of (key path tuple, expected value) for the values to compare
+    Dicts are flattened, lists and scalar values are compared as a whole, and password properties are skipped
+    '''
+    fields = []
+    for key, value in iteritems(template):
+        if re.search(r'P(ass)?w(or)?d', key):
+            continue
+        if isinstance(value, dict) and value:
+            fields.extend(flatten_template(value, path + (key,)))
+        else:
+            fields.append((path + (key,), value))
+    return fields
+
+
+def get_path(obj, path):
+    value = obj
+    for key in path:
+        if not isinstance(value, dict):
+            return MISMATCH
+        if key not in value:
+            return MISSING
+        value = value[key]
+    return value
+
+
+def find_drift(column, expected):
+    '''
+    Return the indexes of the values in column that differ from the expected value
+    '''
+    if isinstance(expected, (list, dict)):
+        # lists are matched item by item with compare_values
+        return [index for (index, value) in enumerate(column)
+                if value is MISMATCH or (value is not MISSING and not compare_values(expected, value))]
+    if HAS_NUMPY:
+        # filled one value at a time, as a slice assignment broadcasts equal length list values into a 2-D array
+        values = numpy.empty(len(column), dtype=object)
+        for index, value in enumerate(column):
+            values[index] = value
+        return numpy.nonzero((values != expected) & (values != MISSING))[0].tolist()
+    return [index for (index, value) in enumerate(column) if value is not MISSING and value != expected]
+
+
+def main():
+    argument_spec = intersight_argument_spec
+    argument_spec.update(
+        resource_path=dict(type='str', required=True),
+        query_params=dict(type='dict', default={}),
+        template=dict(type='dict', required=True),
+        fail_on_drift=dict(type='bool', default=False),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+    )
+
+    start_background_job(module)
+
+    intersight = IntersightModule(module)
+
+    fields = flatten_template(module.params['template'])
+    query_params = dict(module.params['query_params'])
+    if fields:
+        query_params['$select'] = ','.join(sorted(set(path[0] for (path, dummy) in fields)))
+
+    # collect each template property of every object into a column
+    moids = []
+    columns = [[] for dummy in fields]
+    for page in intersight.get_pages(module.params['resource_path'], query_params):
+        for obj in page:
+            moids.append(obj['Moid'])
+            for column, (path, dummy) in zip(columns, fields):
+                column.append(get_path(obj, path))
+
+    drifted = set()
+    intersight.result['fields'] = {}
+    for column, (path, expected) in zip(columns, fields):
+        drift_moids = [moids[index] for index in find_drift(column, expected)]
+        if drift_moids:
+            drifted.update(drift_moids)
+            intersight.result['fields']['.'.join(path)] = dict(expected=expected, drift_count=len(drift_moids), moids=drift_moids)
+    intersight.result['objects_checked'] = len(moids)
+    intersight.result['drifted_moids'] = [moid for moid in moids if moid in drifted]
+    intersight.result['drift_count'] = len(drifted)
+
+    if drifted and module.params['fail_on_drift']:
+        intersight.result['msg'] = "%d of %d objects differ from the template" % (len(drifted), len(moids))
+        module.fail_json(**intersight.result)
+    module.exit_json(**intersight.result)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,9 @@ module: intersight_facts
 short_description: Gather facts about Intersight
 description:
 - Gathers facts about servers in L(Cisco Intersight,https://intersight.com).
-extends_documentation_fragment: intersight
+extends_documentation_fragment:
+- intersight
+- intersight.accounts
 options:
   server_names:
     description:
@@ -24,6 +26,69 @@ options:
     - An empty list will return all servers.
     type: list
     required: yes
+  cache_file:
+    description:
+    - Filename of a local cache used for incremental (delta) refreshes of the server list.
+    - The first run saves all matching servers and the latest ModTime seen (the sync watermark).
+    - Later runs only GET servers with a ModTime at or after the watermark, merge them into the cache,
+      and remove cached servers missing from a Moid only listing of the collection.
+    - Servers in the listing but missing from the cache are fetched by Moid and added to the cache.
+    - The cache is rebuilt with a full refresh if I(api_uri) or I(server_names) change.
+    type: path
+  output_file:
+    description:
+    - Filename where servers are written page by page instead of being returned in I(intersight_servers).
+    - Only one page of servers is held in memory, which keeps memory use low for large estates.
+    - The module returns the number of servers written and, if I(summary_fields) is set, a summary of each server.
+    - In check mode the servers are read and counted, but the file is not written.
+    type: path
+  output_format:
+    description:
+    - Format of the I(output_file).
+    - C(jsonl) writes one JSON object per line (JSON Lines).
+    - C(csv) writes a header row followed by one row per server.  Columns are the I(summary_fields) if set,
+      otherwise the properties of the servers in the first page.  Nested values are JSON encoded.
+    type: str
+    choices: [ jsonl, csv ]
+    default: jsonl
+  summary_fields:
+    description:
+    - Properties returned in I(intersight_servers) for each server when I(output_file) is used.
+    - Nested properties can be given with dots (e.g., AlarmSummary.Critical).
+    type: list
+  gather_subset:
+    description:
+    - Related objects fetched for the servers and joined with each server.
+    - The related collections are fetched concurrently, page by page, with only the listed properties selected.
+    - C(adapters) adds an Adapters list of adapter.Unit objects (Model, Serial, Vendor, AdapterId, OperState, PciSlot).
+    - C(firmware) adds a RunningFirmware list of firmware.RunningFirmware objects (Component, Type, Version, PackageVersion).
+    - C(settings) adds the ServerSettings compute.ServerSetting object (AdminPowerState, AdminLocatorLedState, ConfigState).
+    - C(profiles) adds the ServerProfile server.Profile object assigned to the server (Name, Description, ConfigContext).
+    type: list
+    choices: [ adapters, firmware, settings, profiles ]
+  summary_by:
+    description:
+    - Return counts of the servers grouped by these properties in I(intersight_summary) instead of returning the servers.
+    - The counts are computed by Intersight with C($apply=groupby(...)) queries, so no server objects are transferred.
+    - Each item is a property or a comma separated list of properties grouped together (e.g., C(Model,Firmware)).
+    - Nested properties can be given with dots (e.g., AlarmSummary.Health).
+    - Cannot be used with I(cache_file), I(output_file), or I(gather_subset).
+    type: list
+  compact_results:
+    description:
+    - If C(yes), servers and I(gather_subset) objects are held in a compact form while the module processes them,
+      which greatly reduces the memory used for large numbers of objects.
+    - Objects are stored as records of their ObjectType with interned property names and short strings, and are
+      converted back to dicts when the module returns.
+    - Ownership and audit properties (AccountMoid, Ancestors, ClassId, CreateTime, DomainGroupMoid, Owners,
+      PermissionResources, and SharedScope) are not returned.
+    - Servers are fetched page by page instead of with a single API call.
+    - Requires I(gather_subset), since servers without related objects would be converted back to dicts as soon as
+      they are compacted.
+    type: bool
+    default: no
+notes:
+- I(cache_file) and I(output_file) cannot be used with I(accounts).
 author:
 - David Soper (@dsoper2)
 - CiscoUcs (@CiscoUcs)
@@ -50,12 +115,73 @@ EXAMPLES = r'''
 - debug:
     msg: "server moid {{ intersight_servers[0].Moid }}"
   when: intersight_servers[0] is defined
+
+- name: Refresh facts for all servers, only transferring servers changed since the last run
+  intersight_facts:
+    api_private_key: ~/Downloads/SecretKey.txt
+    api_key_id: 64612d300d0982/64612d300d0b00/64612d300d3650
+    server_names:
+    cache_file: ~/.ansible/intersight_servers.json
+
+- name: Write all servers to a JSON Lines file and only return their names and Moids
+  intersight_facts:
+    api_private_key: ~/Downloads/SecretKey.txt
+    api_key_id: 64612d300d0982/64612d300d0b00/64612d300d3650
+    server_names:
+    output_file: /tmp/intersight_servers.jsonl
+    summary_fields:
+      - Name
+      - Moid
+
+- name: Get servers with their adapters, firmware, and assigned profiles
+  intersight_facts:
+    api_private_key: ~/Downloads/SecretKey.txt
+    api_key_id: 64612d300d0982/64612d300d0b00/64612d300d3650
+    server_names:
+    gather_subset:
+      - adapters
+      - firmware
+      - profiles
+- debug:
+    msg: "{{ item.Name }} profile {{ item.ServerProfile.Name | default('none') }}"
+  loop: "{{ intersight_servers }}"
+
+- name: Count servers by model and by model and firmware version
+  intersight_facts:
+    api_private_key: ~/Downloads/SecretKey.txt
+    api_key_id: 64612d300d0982/64612d300d0b00/64612d300d3650
+    server_names:
+    summary_by:
+      - Model
+      - Model,Firmware
+- debug:
+    msg: "{{ item.Model }}: {{ item.count }}"
+  loop: "{{ intersight_summary.groups.Model }}"
+
+- name: Count servers by model in several accounts at once
+  intersight_facts:
+    accounts:
+      - name: production
+        api_key_id: 64612d300d0982/64612d300d0b00/64612d300d3650
+        api_private_key: ~/Downloads/ProductionSecretKey.txt
+      - name: lab-appliance
+        api_uri: https://intersight-appliance.example.com/api/v1
+        api_key_id: 5d8a1c2b7564612d33a0b6b0/5d8a1c2b7564612d33a0b6b1/5d8a1c2b7564612d33a0b6b2
+        api_private_key: ~/Downloads/LabSecretKey.txt
+    server_names:
+    summary_by:
+      - Model
+- debug:
+    msg: "{{ item.name }}: {{ item.intersight_summary.count }} servers"
+  loop: "{{ intersight_accounts }}"
 '''
 
 RETURN = r'''
 intersight_servers:
-  description: A list of Intersight Servers.  See L(Cisco Intersight,https://intersight.com/apidocs) for details.
-  returned: always
+  description:
+  - A list of Intersight Servers.  See L(Cisco Intersight,https://intersight.com/apidocs) for details.
+  - When I(output_file) is used, only the I(summary_fields) of each server are returned.
+  returned: when output_file is not used or summary_fields is set
   type: complex
   contains:
     Name:
@@ -68,18 +194,107 @@ intersight_servers:
       returned: always
       type: str
       sample: 5978bea36ad4b000018d63dc
+    Adapters:
+      description: Adapters in the server.
+      returned: when gather_subset includes adapters
+      type: list
+    RunningFirmware:
+      description: Firmware running on the server components.
+      returned: when gather_subset includes firmware
+      type: list
+    ServerSettings:
+      description: Power and locator settings of the server.
+      returned: when gather_subset includes settings
+      type: dict
+    ServerProfile:
+      description: Server Profile assigned to the server (null if none).
+      returned: when gather_subset includes profiles
+      type: dict
+intersight_servers_count:
+  description: The number of servers written to the output_file.
+  returned: when output_file is used
+  type: int
+  sample: 1200
+output_file:
+  description: The filename servers were written to.
+  returned: when output_file is used
+  type: str
+  sample: /tmp/intersight_servers.jsonl
+intersight_summary:
+  description: Server counts computed by Intersight.
+  returned: when summary_by is used
+  type: complex
+  contains:
+    count:
+      description: The number of matching servers.
+      returned: always
+      type: int
+      sample: 1200
+    groups:
+      description:
+      - Table of counts for each item of I(summary_by), keyed by the item.
+      - Each row has the grouped properties (with dotted names for nested properties) and a count.
+      returned: always
+      type: dict
+      sample: {"Model": [{"Model": "UCSC-C220-M5", "count": 700}, {"Model": "UCSC-C240-M5", "count": 500}]}
+intersight_accounts:
+  description:
+  - Facts for each of the I(accounts).
+  - Each item has the account name and api_uri and the intersight_servers or intersight_summary of the account.
+  returned: when accounts is used
+  type: list
+  sample: [{"name": "production", "api_uri": "https://intersight.com/api/v1", "intersight_summary": {"count": 1200}}]
 '''
 
-from ansible.module_utils.remote_management.intersight import IntersightModule, intersight_argument_spec
+import csv
+import json
+import os
+import tempfile
+from ansible.module_utils.remote_management.intersight import IntersightModule, intersight_argument_spec, chunks, compact_value, expand_value, \
+    get_in_filter, load_json_file, run_for_accounts, run_in_parallel, start_background_job, write_json_file
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six import iteritems
 
+# related collections for gather_subset
+# join is the property referencing the server; objects joined with Ancestors are returned as a list
+GATHER_SUBSETS = {
+    'adapters': dict(
+        resource_path='/adapter/Units',
+        key='Adapters',
+        join='Ancestors',
+        select='Model,Serial,Vendor,AdapterId,OperState,PciSlot,Ancestors',
+    ),
+    'firmware': dict(
+        resource_path='/firmware/RunningFirmwares',
+        key='RunningFirmware',
+        join='Ancestors',
+        select='Component,Type,Version,PackageVersion,Ancestors',
+    ),
+    'settings': dict(
+        resource_path='/compute/ServerSettings',
+        key='ServerSettings',
+        join='Server',
+        select='AdminPowerState,AdminLocatorLedState,ConfigState,Server',
+    ),
+    'profiles': dict(
+        resource_path='/server/Profiles',
+        key='ServerProfile',
+        join='AssignedServer',
+        select='Name,Description,ConfigContext,AssignedServer',
+    ),
+}
 
-def get_servers(module, intersight):
+
+def get_server_filter(module):
     query_list = []
     if module.params['server_names']:
         for server in module.params['server_names']:
             query_list.append("Name eq '%s'" % server)
-    query_str = ' or '.join(query_list)
+    return ' or '.join(query_list)
+
+
+def get_servers(module, intersight):
+    query_str = get_server_filter(module)
     options = {
         'http_method': 'get',
         'resource_path': '/compute/PhysicalSummaries',
@@ -93,21 +308,283 @@ def get_servers(module, intersight):
     return response_dict.get('Results')
 
 
+def get_servers_delta(module, intersight):
+    resource_path = '/compute/PhysicalSummaries'
+    query_str = get_server_filter(module)
+    cache = load_json_file(module.params['cache_file'])
+    if not cache or cache.get('api_uri') != module.params['api_uri'] or cache.get('filter') != query_str:
+        # no usable cache, so perform a full refresh
+        cache = dict(api_uri=module.params['api_uri'], filter=query_str, watermark=None, servers={})
+    servers = cache['servers']
+
+    if cache['watermark']:
+        # ge (not gt) so servers modified within the same millisecond as the watermark are not missed
+        delta_filter = "ModTime ge %s" % cache['watermark']
+        if query_str:
+            delta_filter = "(%s) and %s" % (query_str, delta_filter)
+        for page in intersight.get_pages(resource_path, {'$filter': delta_filter}):
+            for server in page:
+                servers[server['Moid']] = server
+        # detect deletions with a Moid only listing
+        current_moids = set()
+        for page in intersight.get_pages(resource_path, {'$filter': query_str, '$select': 'Moid'}):
+            current_moids.update(server['Moid'] for server in page)
+        for moid in list(servers):
+            if moid not in current_moids:
+                del servers[moid]
+        # repair the cache with listed servers that the delta query did not return
+        missing = [moid for moid in current_moids if moid not in servers]
+        for server in intersight.get_matching(resource_path, 'Moid', sorted(missing)):
+            servers[server['Moid']] = server
+    else:
+        for page in intersight.get_pages(resource_path, {'$filter': query_str}):
+            for server in page:
+                servers[server['Moid']] = server
+
+    mod_times = [server['ModTime'] for server in servers.values() if server.get('ModTime')]
+    if mod_times:
+        cache['watermark'] = max(mod_times)
+    if not module.check_mode:
+        write_json_file(module.params['cache_file'], cache)
+
+    return list(servers.values())
+
+
+def get_subset_indexes(intersight, subsets, server_moids=None, compact=False):
+    '''
+    Fetch the related collections concurrently and index the objects by the Moid of the server they reference
+    With compact, the indexed objects are compact records
+    '''
+    def get_index(subset):
+        spec = GATHER_SUBSETS[subset]
+        if server_moids is None:
+            query_filters = [None]
+        else:
+            query_filters = [get_in_filter(spec['join'] + '.Moid', batch) for batch in chunks(server_moids, 100)]
+        index = {}
+        for query_filter in query_filters:
+            query_params = {'$select': spec['select']}
+            if query_filter:
+                query_params['$filter'] = query_filter
+            for page in intersight.get_pages(spec['resource_path'], query_params, fail_on_error=False):
+                for obj in page:
+                    refs = obj.get(spec['join']) or []
+                    if isinstance(refs, dict):
+                        refs = [refs]
+                    if compact:
+                        obj = compact_value(obj)
+                    for ref in refs:
+                        index.setdefault(ref['Moid'], []).append(obj)
+        return index
+
+    indexes = {}
+    for subset, (index, error) in zip(subsets, run_in_parallel(get_index, subsets, len(subsets))):
+        if error:
+            intersight.module.fail_json(msg="API error: %s " % str(error))
+        indexes[subset] = index
+    return indexes
+
+
+def join_subsets(servers, indexes):
+    '''
+    Add the related objects to each server
+    '''
+    for server in servers:
+        for subset, index in iteritems(indexes):
+            spec = GATHER_SUBSETS[subset]
+            related = index.get(server['Moid'], [])
+            if spec['join'] == 'Ancestors':
+                server[spec['key']] = related
+            else:
+                server[spec['key']] = related[0] if related else None
+    return servers
+
+
+def get_summary(module, intersight):
+    '''
+    Count the servers and group the counts by each summary_by item with server side aggregation queries
+    '''
+    query_filter = get_server_filter(module)
+    group_by = module.params['summary_by']
+
+    def get_count(item):
+        query_params = {}
+        if query_filter:
+            query_params['$filter'] = query_filter
+        if item is None:
+            query_params['$count'] = 'true'
+            return intersight.api_request(http_method='get', resource_path='/compute/PhysicalSummaries', query_params=query_params)['Count']
+        fields = [field.strip() for field in item.split(',')]
+        query_params['$apply'] = 'groupby((%s),aggregate($count as count))' % ','.join(field.replace('.', '/') for field in fields)
+        response = intersight.api_request(http_method='get', resource_path='/compute/PhysicalSummaries', query_params=query_params)
+        rows = []
+        for group in response.get('Results') or []:
+            row = dict((field, get_field(group, field)) for field in fields)
+            row['count'] = group.get('count')
+            rows.append(row)
+        return sorted(rows, key=lambda row: -(row['count'] or 0))
+
+    # the total count and each grouping are independent queries
+    items = [None] + group_by
+    counts = []
+    for item, (count, error) in zip(items, run_in_parallel(get_count, items, len(items))):
+        if error:
+            module.fail_json(msg="API error: %s " % str(error))
+        counts.append(count)
+    return dict(count=counts[0], groups=dict(zip(group_by, counts[1:])))
+
+
+def get_field(server, path):
+    value = server
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def write_output(module, pages):
+    '''
+    Write each page of servers to the output_file and return the count and optional summary
+    '''
+    path = module.params['output_file']
+    fields = module.params['summary_fields']
+    result = dict(changed=False, output_file=path, intersight_servers_count=0)
+    if fields:
+        result['intersight_servers'] = []
+
+    def write_pages(f):
+        writer = None
+        for page in pages:
+            if module.params['output_format'] == 'csv' and writer is None:
+                columns = fields or sorted(set(key for server in page for key in server))
+                writer = csv.writer(f)
+                writer.writerow(columns)
+            for server in page:
+                if writer:
+                    writer.writerow([csv_value(get_field(server, column)) for column in columns])
+                else:
+                    f.write(json.dumps(server) + '\n')
+                if fields:
+                    result['intersight_servers'].append(dict((field, get_field(server, field)) for field in fields))
+                result['intersight_servers_count'] += 1
+
+    if module.check_mode:
+        # like the cache_file, the output_file is not written in check mode, but the servers are still counted
+        with open(os.devnull, 'w') as f:
+            write_pages(f)
+        return result
+
+    # write to a temporary file so the output_file is only replaced when all pages were written
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.intersight-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            write_pages(f)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    return result
+
+
+def gather_facts(module, intersight):
+    '''
+    Return the facts for the module options
+    '''
+    if module.params['summary_by']:
+        return dict(intersight_summary=get_summary(module, intersight))
+
+    if module.params['cache_file']:
+        # incremental refresh merged into the local cache
+        servers = get_servers_delta(module, intersight)
+    elif module.params['output_file'] and not module.params['server_names']:
+        # all servers are paged through when written so only one page is held in memory
+        servers = None
+    elif module.params['compact_results']:
+        # compact each page of servers so only one page of full objects is held in memory
+        pages = intersight.get_pages('/compute/PhysicalSummaries', {'$filter': get_server_filter(module)})
+        servers = [compact_value(server) for page in pages for server in page] or None
+    else:
+        # one API call returning all requested servers
+        servers = get_servers(module, intersight)
+
+    indexes = {}
+    if module.params['gather_subset']:
+        server_moids = None
+        if module.params['server_names']:
+            # only fetch related objects for the requested servers
+            server_moids = [server['Moid'] for server in servers or []]
+        indexes = get_subset_indexes(intersight, module.params['gather_subset'], server_moids, module.params['compact_results'])
+        if servers:
+            join_subsets(servers, indexes)
+
+    if module.params['compact_results']:
+        # records are only converted to dicts for the module result
+        servers = expand_value(servers)
+
+    if module.params['output_file']:
+        if servers is None:
+            pages = (join_subsets(page, indexes) for page in intersight.get_pages('/compute/PhysicalSummaries', {'$filter': get_server_filter(module)}))
+            if module.params['compact_results']:
+                pages = (expand_value(page) for page in pages)
+        else:
+            pages = [servers]
+        return write_output(module, pages)
+    return dict(intersight_servers=servers)
+
+
 def main():
     argument_spec = intersight_argument_spec
     argument_spec.update(
         server_names=dict(type='list', required=True),
+        cache_file=dict(type='path'),
+        output_file=dict(type='path'),
+        output_format=dict(type='str', choices=['jsonl', 'csv'], default='jsonl'),
+        summary_fields=dict(type='list'),
+        gather_subset=dict(type='list', choices=list(GATHER_SUBSETS)),
+        summary_by=dict(type='list'),
+        accounts=dict(type='list'),
+        compact_results=dict(type='bool', default=False),
     )
 
     module = AnsibleModule(
         argument_spec,
         supports_check_mode=True,
+        mutually_exclusive=[
+            ['summary_by', 'cache_file'],
+            ['summary_by', 'output_file'],
+            ['summary_by', 'gather_subset'],
+            ['accounts', 'cache_file'],
+            ['accounts', 'output_file'],
+        ],
+        required_if=[
+            ['compact_results', True, ['gather_subset']],
+        ],
     )
 
-    intersight = IntersightModule(module)
+    start_background_job(module)
+
+    if module.params['accounts']:
+        def gather_account_facts(intersight):
+            intersight.result.update(gather_facts(intersight.module, intersight))
 
-    # one API call returning all requested servers
-    module.exit_json(intersight_servers=get_servers(module, intersight))
+        accounts = run_for_accounts(module, gather_account_facts)
+        errors = ["%s: %s" % (account['name'], account['msg']) for account in accounts if account.get('failed')]
+        if errors:
+            module.fail_json(msg="Account errors: %s" % '; '.join(errors), intersight_accounts=accounts)
+        module.exit_json(intersight_accounts=accounts)
+
+    intersight = IntersightModule(module)
+    module.exit_json(**gather_facts(module, intersight))
 
 
 if __name__ == '__main__':
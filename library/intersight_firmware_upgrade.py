@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: intersight_firmware_upgrade
+short_description: Rolling firmware upgrades for many servers in Cisco Intersight
+description:
+- Runs firmware upgrades (firmware.Upgrade objects) for a list of servers in L(Cisco Intersight,https://intersight.com).
+- At most I(max_in_flight) upgrades run at once and a new upgrade is started as soon as a running upgrade completes.
+- The status of running upgrades is polled with batched queries.
+- No new upgrades are started once the percentage of failed upgrades exceeds I(max_fail_percentage).
+  Upgrades that are already running are still waited on.
+- An upgrade is started for every server in the list.  The running firmware version is not checked.
+- Status queries that fail are retried at the next poll until I(timeout).
+extends_documentation_fragment: intersight
+options:
+  servers:
+    description:
+    - List of server Moids or server names to upgrade.
+    - Values that are not 24 character Moids are looked up by name.
+    type: list
+    required: yes
+  api_body:
+    description:
+    - Properties of the firmware.Upgrade objects created for each server (e.g., UpgradeType and NetworkShare).
+    - The Server property is set by this module.
+    type: dict
+    required: yes
+  max_in_flight:
+    description:
+    - Maximum number of upgrades running at the same time.  Must be at least 1.
+    type: int
+    default: 5
+  max_fail_percentage:
+    description:
+    - Stop starting new upgrades once the percentage of failed upgrades is greater than this value.
+    - The default of 0 stops on the first failure.
+    type: int
+    default: 0
+  poll_interval:
+    description:
+    - Seconds to wait between status checks of running upgrades.
+    type: int
+    default: 60
+  batch_size:
+    description:
+    - Number of upgrades checked by each status query.
+    type: int
+    default: 100
+  timeout:
+    description:
+    - Maximum number of seconds to wait for all upgrades to complete.
+    type: int
+    default: 14400
+author:
+- David Soper (@dsoper2)
+- CiscoUcs (@CiscoUcs)
+version_added: '2.8'
+'''
+
+EXAMPLES = r'''
+- name: Upgrade all C240 M5 servers in the play, 10 at a time
+  intersight_firmware_upgrade:
+    api_private_key: "{{ api_private_key }}"
+    api_key_id: "{{ api_key_id }}"
+    servers: "{{ ansible_play_hosts | map('extract', hostvars, 'server_moid') | list }}"
+    max_in_flight: 10
+    max_fail_percentage: 10
+    api_body: {
+      "NetworkShare": {
+        "MapType": "nfs",
+        "Upgradeoption": "nw_upgrade_mount_only",
+        "NfsServer": {
+          "RemoteIp": "172.28.224.77",
+          "RemoteShare": "/mnt/SHARE/ISOS/HUU/4.0",
+          "RemoteFile": "ucs-c240m5-huu-4.0.4f.iso"
+        }
+      },
+      "UpgradeType": "network_upgrade"
+    }
+  delegate_to: localhost
+  run_once: true
+'''
+
+RETURN = r'''
+servers:
+  description: Per server upgrade results.
+  returned: always
+  type: complex
+  contains:
+    Moid:
+      description: The Moid of the server.
+      returned: always
+      type: str
+      sample: 5978bea36ad4b000018d63dc
+    Upgrade:
+      description: The Moid of the firmware.Upgrade object created for the server.
+      returned: when the upgrade was started
+      type: str
+      sample: 5978bea36ad4b000018d63dd
+    status:
+      description: One of succeeded, failed, timeout, skipped (not started after the failure threshold was exceeded), or pending (check mode).
+      returned: always
+      type: str
+      sample: succeeded
+    msg:
+      description: Error details for failed upgrades.
+      returned: when the upgrade failed
+      type: str
+upgrades_succeeded:
+  description: Number of successful upgrades.
+  returned: always
+  type: int
+upgrades_failed:
+  description: Number of failed or timed out upgrades.
+  returned: always
+  type: int
+'''
+
+import time
+from ansible.module_utils.remote_management.intersight import IntersightModule, intersight_argument_spec, chunks, get_in_filter, \
+    report_progress, run_in_parallel, start_background_job
+from ansible.module_utils.basic import AnsibleModule
+
+# firmware.UpgradeStatus Overallstatus values that complete an upgrade
+UPGRADE_SUCCESS = ['success']
+UPGRADE_FAILURE = ['failed', 'failure', 'download_failed', 'upgrade_failed', 'terminated']
+
+
+class FirmwareUpgrades():
+
+    def __init__(self, intersight, server_moids):
+        self.intersight = intersight
+        self.params = intersight.module.params
+        self.pending = list(server_moids)
+        self.in_flight = {}
+        self.results = dict((moid, dict(Moid=moid, status='pending')) for moid in server_moids)
+        self.failures = 0
+        self.poll_error = None
+
+    def finish(self, server_moid, status, msg=None):
+        self.results[server_moid]['status'] = status
+        if msg:
+            self.results[server_moid]['msg'] = msg
+        if status != 'succeeded':
+            self.failures += 1
+
+    def threshold_exceeded(self):
+        return self.failures * 100.0 / len(self.results) > self.params['max_fail_percentage']
+
+    def start_upgrades(self):
+        slots = self.params['max_in_flight'] - len(self.in_flight)
+        start_list = self.pending[:slots]
+        self.pending = self.pending[slots:]
+
+        def start_upgrade(server_moid):
+            api_body = dict(self.params['api_body'])
+            api_body['Server'] = {'Moid': server_moid}
+            options = {
+                'http_method': 'post',
+                'resource_path': '/firmware/Upgrades',
+                'body': api_body,
+            }
+            return self.intersight.api_request(**options)
+
+        for server_moid, (response, error) in zip(start_list, run_in_parallel(start_upgrade, start_list, self.params['max_in_flight'])):
+            if error:
+                self.finish(server_moid, 'failed', "API error: %s " % str(error))
+            else:
+                self.results[server_moid]['Upgrade'] = response['Moid']
+                self.in_flight[response['Moid']] = server_moid
+
+    def poll_upgrades(self):
+        # a failed status query is retried at the next poll so running upgrades are not abandoned
+        def get_batch(batch):
+            options = {
+                'http_method': 'get',
+                'resource_path': '/firmware/Upgrades',
+                'query_params': {
+                    '$filter': get_in_filter('Moid', batch),
+                    '$top': len(batch),
+                    '$expand': 'UpgradeStatus($select=Overallstatus,Overallerror)',
+                },
+            }
+            return self.intersight.api_request(**options).get('Results') or []
+
+        batches = list(chunks(list(self.in_flight), self.params['batch_size']))
+        for upgrades, error in run_in_parallel(get_batch, batches):
+            if error:
+                self.poll_error = "API error: %s " % str(error)
+                continue
+            for upgrade in upgrades:
+                upgrade_status = upgrade.get('UpgradeStatus') or {}
+                status = upgrade_status.get('Overallstatus')
+                if status in UPGRADE_SUCCESS:
+                    self.finish(self.in_flight.pop(upgrade['Moid']), 'succeeded')
+                elif status in UPGRADE_FAILURE:
+                    self.finish(self.in_flight.pop(upgrade['Moid']), 'failed', upgrade_status.get('Overallerror') or status)
+
+    def run(self):
+        deadline = time.time() + self.params['timeout']
+        while self.pending or self.in_flight:
+            if self.pending and self.threshold_exceeded():
+                # stop starting upgrades, but wait for the running upgrades to complete
+                for server_moid in self.pending:
+                    self.results[server_moid]['status'] = 'skipped'
+                self.pending = []
+            if self.pending:
+                self.start_upgrades()
+            if time.time() > deadline:
+                msg = 'upgrade did not complete within the timeout'
+                if self.poll_error:
+                    msg += ' (last status query error: %s)' % self.poll_error
+                for server_moid in self.in_flight.values():
+                    self.finish(server_moid, 'timeout', msg)
+                for server_moid in self.pending:
+                    self.results[server_moid]['status'] = 'skipped'
+                break
+            if not self.in_flight:
+                continue
+            time.sleep(self.params['poll_interval'])
+            self.poll_upgrades()
+            self.report_progress()
+
+    def report_progress(self):
+        statuses = [result['status'] for result in self.results.values()]
+        report_progress(
+            self.intersight.module,
+            pending=len(self.pending),
+            in_flight=len(self.in_flight),
+            succeeded=statuses.count('succeeded'),
+            failed=self.failures,
+        )
+
+
+def main():
+    argument_spec = intersight_argument_spec
+    argument_spec.update(
+        servers=dict(type='list', required=True),
+        api_body=dict(type='dict', required=True),
+        max_in_flight=dict(type='int', default=5),
+        max_fail_percentage=dict(type='int', default=0),
+        poll_interval=dict(type='int', default=60),
+        batch_size=dict(type='int', default=100),
+        timeout=dict(type='int', default=14400),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+    )
+
+    if module.params['max_in_flight'] < 1:
+        module.fail_json(msg="max_in_flight must be at least 1")
+
+    start_background_job(module)
+
+    intersight = IntersightModule(module)
+
+    server_moids = intersight.get_server_moids(module.params['servers'], batch_size=module.params['batch_size'])
+    upgrades = FirmwareUpgrades(intersight, server_moids)
+    if not module.check_mode:
+        upgrades.run()
+
+    intersight.result['servers'] = [upgrades.results[moid] for moid in server_moids]
+    intersight.result['upgrades_succeeded'] = len([result for result in intersight.result['servers'] if result['status'] == 'succeeded'])
+    intersight.result['upgrades_failed'] = upgrades.failures
+    if module.check_mode:
+        intersight.result['changed'] = bool(server_moids)
+    else:
+        intersight.result['changed'] = any('Upgrade' in result for result in intersight.result['servers'])
+
+    if upgrades.failures:
+        intersight.result['msg'] = "%d of %d firmware upgrades failed" % (upgrades.failures, len(server_moids))
+        module.fail_json(**intersight.result)
+    module.exit_json(**intersight.result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: intersight_job_status
+short_description: Check on Cisco Intersight modules running in the background
+description:
+- Returns the status, progress, and result of an Intersight module started with I(background=yes).
+- Only the local job file is read, so checking a job does not make any Intersight API calls.
+- The module fails if the job failed or if its worker exited without a result.
+options:
+  job_id:
+    description:
+    - The job_id returned by the background module.
+    type: str
+    required: yes
+  job_dir:
+    description:
+    - Directory of the job files.  Must match the I(job_dir) of the background module.
+    type: path
+    default: ~/.ansible/intersight_jobs
+  wait:
+    description:
+    - If C(yes), wait for the job to finish.
+    type: bool
+    default: no
+  timeout:
+    description:
+    - Maximum number of seconds to wait for the job with I(wait).
+    type: int
+    default: 3600
+  poll_interval:
+    description:
+    - Seconds between checks of the job file with I(wait).
+    type: int
+    default: 5
+  cleanup:
+    description:
+    - If C(yes), remove the job file once the job has finished.
+    type: bool
+    default: no
+author:
+- David Soper (@dsoper2)
+- CiscoUcs (@CiscoUcs)
+version_added: '2.8'
+'''
+
+EXAMPLES = r'''
+- name: Start firmware upgrades for several server groups in the background
+  intersight_firmware_upgrade:
+    api_private_key: "{{ api_private_key }}"
+    api_key_id: "{{ api_key_id }}"
+    servers: "{{ item.servers }}"
+    api_body: "{{ upgrade_body }}"
+    background: yes
+  loop: "{{ server_groups }}"
+  register: upgrade_jobs
+
+- name: Wait for all upgrades to finish
+  intersight_job_status:
+    job_id: "{{ item.job_id }}"
+    wait: yes
+    timeout: 14400
+    poll_interval: 60
+  loop: "{{ upgrade_jobs.results }}"
+
+- name: Check on a background delete
+  intersight_job_status:
+    job_id: "{{ delete_job.job_id }}"
+  register: delete_status
+- debug:
+    msg: "{{ delete_status.progress.deleted | default(0) }} objects deleted"
+'''
+
+RETURN = r'''
+status:
+  description: One of running, finished, or failed.
+  returned: always
+  type: str
+  sample: running
+finished:
+  description: Whether the job has finished (successfully or not).
+  returned: always
+  type: bool
+  sample: false
+progress:
+  description:
+  - Progress reported by the background module, updated at most once a second.
+  - Includes the number of API calls made (api_calls) and module specific counts (e.g., deleted and remaining for
+    intersight_rest_api with delete_all, or pending, in_flight, succeeded, and failed for intersight_firmware_upgrade).
+  returned: always
+  type: dict
+  sample: {"api_calls": 120, "deleted": 80, "remaining": 20}
+job_result:
+  description: The result the module would have returned if it had not been run in the background.
+  returned: when the job has finished
+  type: dict
+started:
+  description: Start time of the job (seconds since the epoch).
+  returned: always
+  type: float
+'''
+
+import os
+import time
+from ansible.module_utils.remote_management.intersight import load_json_file
+from ansible.module_utils.basic import AnsibleModule
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # EPERM means the process exists but belongs to another user
+        return e.errno == 1
+    return True
+
+
+def get_job(module, job_file):
+    job = load_json_file(job_file)
+    if job is None:
+        module.fail_json(msg="Job file %s not found" % job_file)
+    if job['status'] == 'running' and job.get('pid') and not pid_exists(job['pid']):
+        # the file may have been written as the worker exited
+        job = load_json_file(job_file)
+        if job['status'] == 'running':
+            job['status'] = 'failed'
+            job['result'] = dict(failed=True, msg="The background worker exited without a result")
+    return job
+
+
+def main():
+    argument_spec = dict(
+        job_id=dict(type='str', required=True),
+        job_dir=dict(type='path', default='~/.ansible/intersight_jobs'),
+        wait=dict(type='bool', default=False),
+        timeout=dict(type='int', default=3600),
+        poll_interval=dict(type='int', default=5),
+        cleanup=dict(type='bool', default=False),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+    )
+
+    job_file = os.path.join(module.params['job_dir'], module.params['job_id'] + '.json')
+    job = get_job(module, job_file)
+    deadline = time.time() + module.params['timeout']
+    while module.params['wait'] and job['status'] == 'running':
+        if time.time() > deadline:
+            module.fail_json(msg="Timeout waiting for job %s" % module.params['job_id'], status=job['status'],
+                             finished=False, progress=job['progress'], started=job['started'])
+        time.sleep(module.params['poll_interval'])
+        job = get_job(module, job_file)
+
+    result = dict(
+        changed=False,
+        status=job['status'],
+        finished=job['status'] != 'running',
+        progress=job['progress'],
+        started=job['started'],
+    )
+    if result['finished']:
+        result['job_result'] = job.get('result') or {}
+        if module.params['cleanup'] and not module.check_mode and os.path.exists(job_file):
+            os.remove(job_file)
+    if job['status'] == 'failed':
+        result['msg'] = result['job_result'].get('msg') or "Job %s failed" % module.params['job_id']
+        module.fail_json(**result)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
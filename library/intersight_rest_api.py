@@ -18,7 +18,9 @@ description:
 - Direct REST API configuration for Cisco Intersight.
 - All REST API resources and properties must be specified.
 - For more information see L(Cisco Intersight,https://intersight.com/apidocs).
-extends_documentation_fragment: intersight
+extends_documentation_fragment:
+- intersight
+- intersight.accounts
 options:
   resource_path:
     description:
@@ -53,6 +55,42 @@ options:
     - If C(absent), will verify the resource is absent and will delete if needed.
     choices: [present, absent]
     default: present
+  delete_all:
+    description:
+    - If C(yes) with state C(absent), every object matching the I(query_params) is deleted instead of only the first.
+    - Requires state C(absent) and a C($filter) in I(query_params), so a whole collection cannot be deleted by mistake.
+    - The matching objects are paged through and deleted concurrently.
+    - Deletes that fail (e.g., because another matching object still references the object) are retried in later waves
+      as long as each wave deletes at least one object.
+    - Per object results are returned in I(objects).
+    type: bool
+    default: no
+  max_workers:
+    description:
+    - Maximum number of concurrent deletes with I(delete_all).
+    type: int
+    default: 10
+  ledger_file:
+    description:
+    - Filename of a local ledger of applied configuration used to skip API calls when the I(api_body) has not changed.
+    - After a successful run with state C(present) and an I(api_body), a hash of the I(api_body) is recorded with the Moid,
+      ModTime, and api_response of the object (keyed by I(api_uri), I(api_key_id), I(resource_path), and I(query_params)).
+    - Later runs with the same I(api_body) use the ledger instead of a GET of the resource (see I(ledger_mode)).
+    - Objects deleted with state C(absent) are removed from the ledger.
+    - The file is locked while it is updated, so it can be shared by concurrent tasks.
+    type: path
+  ledger_mode:
+    description:
+    - How unchanged I(api_body) values found in the I(ledger_file) are handled.
+    - C(verify) confirms the object still has the recorded ModTime with a single query selecting only ModTime.
+      If the object was changed or deleted out of band, the resource is read and configured as usual.
+    - Each task verifies only its own object, so C(verify) still makes one API call per object (e.g., per loop item),
+      although the call only returns the Moid and ModTime instead of the full object.
+      Only C(trust) makes no-op runs over many objects without API calls.
+    - C(trust) makes no API calls and returns the recorded api_response.  Changes made outside of Ansible are not detected.
+    type: str
+    choices: [ trust, verify ]
+    default: verify
 author:
 - David Soper (@dsoper2)
 - CiscoUcs (@CiscoUcs)
@@ -100,6 +138,48 @@ EXAMPLES = r'''
     query_params:
       $filter: "Name eq 'vmedia-localdisk'"
     state: absent
+
+- name: Delete all Boot Policies with names starting with test-
+  intersight_rest_api:
+    api_private_key: "{{ api_private_key }}"
+    api_key_id: "{{ api_key_id }}"
+    resource_path: /boot/PrecisionPolicies
+    query_params:
+      $filter: "startswith(Name, 'test-')"
+    state: absent
+    delete_all: yes
+    max_workers: 20
+
+- name: Configure the same NTP Policy in several accounts at once
+  intersight_rest_api:
+    accounts:
+      - name: production
+        api_key_id: "{{ production_api_key_id }}"
+        api_private_key: "{{ production_api_private_key }}"
+      - name: lab-appliance
+        api_uri: https://intersight-appliance.example.com/api/v1
+        api_key_id: "{{ lab_api_key_id }}"
+        api_private_key: "{{ lab_api_private_key }}"
+    resource_path: /ntp/Policies
+    query_params:
+      $filter: "Name eq 'lab-ntp'"
+    api_body: {
+      "Name": "lab-ntp",
+      "Enabled": true,
+      "NtpServers": ["ntp.esl.cisco.com"]
+    }
+
+- name: Configure NTP Policies, skipping policies already configured by an earlier run
+  intersight_rest_api:
+    api_private_key: "{{ api_private_key }}"
+    api_key_id: "{{ api_key_id }}"
+    resource_path: /ntp/Policies
+    query_params:
+      $filter: "Name eq '{{ item.Name }}'"
+    api_body: "{{ item }}"
+    ledger_file: ~/.ansible/intersight_ledger.json
+    ledger_mode: verify
+  loop: "{{ ntp_policies }}"
 '''
 
 RETURN = r'''
@@ -128,13 +208,48 @@ api_repsonse:
       "Name": "vmedia-localdisk",
       "ObjectType": "boot.PrecisionPolicy",
     }
+intersight_accounts:
+  description:
+  - Results for each of the I(accounts).
+  - Each item has the account name and api_uri with the changed, api_response, and trace_id of the account.
+  returned: when accounts is used
+  type: list
+  sample: [{"name": "production", "api_uri": "https://intersight.com/api/v1", "changed": true, "api_response": {"Name": "lab-ntp"}}]
+objects:
+  description: Per object results of I(delete_all).
+  returned: when delete_all is used
+  type: complex
+  contains:
+    Moid:
+      description: The Moid of the object.
+      returned: always
+      type: str
+      sample: 5978bea36ad4b000018d63dc
+    status:
+      description: One of deleted, failed, or pending (check mode).
+      returned: always
+      type: str
+      sample: deleted
+    attempts:
+      description: Number of delete attempts.
+      returned: always
+      type: int
+      sample: 1
+    msg:
+      description: Error details of the last attempt for failed deletes.
+      returned: when the delete failed
+      type: str
+ledger_hit:
+  description: Whether the api_response was taken from the ledger_file because the api_body had already been applied.
+  returned: when ledger_file is used
+  type: bool
+  sample: true
 '''
 
 
-import re
-from ansible.module_utils.remote_management.intersight import IntersightModule, intersight_argument_spec
+from ansible.module_utils.remote_management.intersight import IntersightModule, Ledger, intersight_argument_spec, compare_values, run_for_accounts, \
+    report_progress, run_in_parallel, start_background_job
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.six import iteritems
 
 
 def get_resource(intersight):
@@ -156,37 +271,6 @@ def get_resource(intersight):
     intersight.result['trace_id'] = response.get('trace_id')
 
 
-def compare_lists(expected_list, actual_list):
-    if len(expected_list) != len(actual_list):
-        # mismatch if list lengths aren't equal
-        return False
-    for expected, actual in zip(expected_list, actual_list):
-        # if compare_values returns False, stop the loop and return
-        if not compare_values(expected, actual):
-            return False
-    # loop complete with all items matching
-    return True
-
-
-def compare_values(expected, actual):
-    try:
-        if isinstance(expected, list) and isinstance(actual, list):
-            return compare_lists(expected, actual)
-        for (key, value) in iteritems(expected):
-            if re.search(r'P(ass)?w(or)?d', key) or key not in actual:
-                # do not compare any password related attributes or attributes that are not in the actual resource
-                continue
-            if not compare_values(value, actual[key]):
-                return False
-        # loop complete with all items matching
-        return True
-    except (AttributeError, TypeError):
-        # if expected and actual != expected:
-        if actual != expected:
-            return False
-        return True
-
-
 def configure_resource(intersight, moid):
     if not intersight.module.check_mode:
         if moid:
@@ -229,38 +313,94 @@ def delete_resource(intersight, moid):
     intersight.result['changed'] = True
 
 
-def main():
-    argument_spec = intersight_argument_spec
-    argument_spec.update(
-        resource_path=dict(type='str', required=True),
-        query_params=dict(type='dict', default={}),
-        update_method=dict(type='str', choices=['patch', 'post'], default='patch'),
-        api_body=dict(type='dict', default={}),
-        return_list=dict(type='bool', default=False),
-        state=dict(type='str', choices=['absent', 'present'], default='present'),
-    )
+def delete_all_resources(intersight):
+    '''
+    Delete every object matching the query_params with concurrent DELETEs
+    Failed deletes (e.g., objects still referenced by other objects being deleted) are retried in later waves
+    while each wave deletes at least one object
+    '''
+    query_params = dict(intersight.module.params['query_params'])
+    for paging_param in ['$top', '$skip']:
+        query_params.pop(paging_param, None)
+    query_params['$select'] = 'Moid'
+    moids = [obj['Moid'] for page in intersight.get_pages(intersight.module.params['resource_path'], query_params) for obj in page]
+    objects = dict((moid, dict(Moid=moid, status='pending', attempts=0)) for moid in moids)
+    intersight.result['objects'] = [objects[moid] for moid in moids]
+    intersight.result['changed'] = bool(moids)
+    if intersight.module.check_mode:
+        return
 
-    module = AnsibleModule(
-        argument_spec,
-        supports_check_mode=True,
-        mutually_exclusive=[
-            ['return_list', 'api_body'],
-            ['return_list', 'state'],
-        ],
-    )
+    def delete(moid):
+        options = {
+            'http_method': 'delete',
+            'resource_path': intersight.module.params['resource_path'],
+            'moid': moid,
+        }
+        return intersight.api_request(**options)
 
-    intersight = IntersightModule(module)
+    pending = moids
+    while pending:
+        failed = []
+        for moid, (dummy, error) in zip(pending, run_in_parallel(delete, pending, intersight.module.params['max_workers'])):
+            objects[moid]['attempts'] += 1
+            if error and error.args[0] != 404:
+                objects[moid]['msg'] = "API error: %s " % str(error)
+                failed.append(moid)
+            else:
+                # already deleted objects are not errors
+                objects[moid]['status'] = 'deleted'
+                objects[moid].pop('msg', None)
+        report_progress(intersight.module, deleted=len(moids) - len(failed), remaining=len(failed))
+        if len(failed) == len(pending):
+            # no progress, so retrying would fail again
+            for moid in failed:
+                objects[moid]['status'] = 'failed'
+            break
+        pending = failed
+
+    failures = [moid for moid in moids if objects[moid]['status'] == 'failed']
+    intersight.result['changed'] = len(failures) < len(moids)
+    if failures:
+        intersight.module.fail_json(msg="%d of %d deletes failed" % (len(failures), len(moids)), **intersight.result)
+
+
+def run_rest_api(intersight):
+    '''
+    GET the resource and configure or delete it as requested
+    '''
     intersight.result['api_response'] = {}
     intersight.result['trace_id'] = ''
 
+    ledger = None
+    if intersight.module.params['ledger_file']:
+        ledger = Ledger(intersight.module.params['ledger_file'])
+        ledger_key = Ledger.get_key(intersight.module.params['api_uri'], intersight.module.params['api_key_id'],
+                                    intersight.module.params['resource_path'], intersight.module.params['query_params'])
+        intersight.result['ledger_hit'] = False
+        if intersight.module.params['state'] == 'present' and intersight.module.params['api_body']:
+            entry = ledger.lookup(ledger_key, intersight.module.params['api_body'])
+            if entry and (intersight.module.params['ledger_mode'] == 'trust' or
+                          ledger.verify(intersight, intersight.module.params['resource_path'], {ledger_key: entry})):
+                # the same api_body was applied by an earlier run and the object has not changed since
+                intersight.result['api_response'] = entry['api_response']
+                intersight.result['ledger_hit'] = True
+                return
+
+    if intersight.module.params['state'] == 'absent' and intersight.module.params['delete_all']:
+        delete_all_resources(intersight)
+        if ledger is not None and not intersight.module.check_mode:
+            ledger.forget(ledger_key)
+            ledger.save()
+        return
+
     # get the current state of the resource
     get_resource(intersight)
 
     # determine requested operation (config, delete, or neither (get resource only))
-    if module.params['state'] == 'present':
+    if intersight.module.params['state'] == 'present':
         request_delete = False
         # api_body implies resource configuration through post/patch
-        request_config = bool(module.params['api_body'])
+        request_config = bool(intersight.module.params['api_body'])
     else:  # state == 'absent'
         request_delete = True
         request_config = False
@@ -271,13 +411,69 @@ def main():
         # resource exists and moid was returned
         moid = intersight.result['api_response']['Moid']
         if request_config:
-            resource_values_match = compare_values(module.params['api_body'], intersight.result['api_response'])
+            resource_values_match = compare_values(intersight.module.params['api_body'], intersight.result['api_response'])
         else:  # request_delete
             delete_resource(intersight, moid)
 
     if request_config and not resource_values_match:
         configure_resource(intersight, moid)
 
+    if ledger is not None and not intersight.module.check_mode:
+        if request_delete:
+            ledger.forget(ledger_key)
+        elif request_config:
+            if moid and not resource_values_match:
+                # record the ModTime set by the update (created resources were already read after the POST)
+                get_resource(intersight)
+            if intersight.result['api_response'].get('Moid'):
+                ledger.record(ledger_key, intersight.module.params['api_body'], intersight.result['api_response'])
+        ledger.save()
+
+
+def main():
+    argument_spec = intersight_argument_spec
+    argument_spec.update(
+        resource_path=dict(type='str', required=True),
+        query_params=dict(type='dict', default={}),
+        update_method=dict(type='str', choices=['patch', 'post'], default='patch'),
+        api_body=dict(type='dict', default={}),
+        return_list=dict(type='bool', default=False),
+        state=dict(type='str', choices=['absent', 'present'], default='present'),
+        accounts=dict(type='list'),
+        ledger_file=dict(type='path'),
+        ledger_mode=dict(type='str', choices=['trust', 'verify'], default='verify'),
+        delete_all=dict(type='bool', default=False),
+        max_workers=dict(type='int', default=10),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+        mutually_exclusive=[
+            ['return_list', 'api_body'],
+            ['return_list', 'state'],
+        ],
+    )
+
+    if module.params['delete_all']:
+        if module.params['state'] != 'absent':
+            module.fail_json(msg="delete_all can only be used with state absent")
+        if not module.params['query_params'].get('$filter'):
+            # an empty query would delete every object in the collection
+            module.fail_json(msg="delete_all requires a $filter in query_params")
+
+    start_background_job(module)
+
+    if module.params['accounts']:
+        accounts = run_for_accounts(module, run_rest_api)
+        errors = ["%s: %s" % (account['name'], account['msg']) for account in accounts if account.get('failed')]
+        result = dict(changed=any(account['changed'] for account in accounts), intersight_accounts=accounts)
+        if errors:
+            module.fail_json(msg="Account errors: %s" % '; '.join(errors), **result)
+        module.exit_json(**result)
+
+    intersight = IntersightModule(module)
+    run_rest_api(intersight)
     module.exit_json(**intersight.result)
 
 
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: intersight_server_actions
+short_description: Configure power and locator state for many servers in Cisco Intersight
+description:
+- Sets the power and locator LED state of a list of servers in L(Cisco Intersight,https://intersight.com) from a single task.
+- Server settings are read with batched queries and only servers whose settings differ are updated.
+- Updates are sent concurrently.
+extends_documentation_fragment: intersight
+options:
+  servers:
+    description:
+    - List of server Moids or server names to configure.
+    - Values that are not 24 character Moids are looked up by name.
+    type: list
+    required: yes
+  power_state:
+    description:
+    - Desired power state (AdminPowerState) of the servers.
+    type: str
+    choices: [ Policy, PowerOn, PowerOff, PowerCycle, HardReset, Shutdown, Reboot ]
+  locator_state:
+    description:
+    - Desired locator LED state (AdminLocatorLedState) of the servers.
+    type: str
+    choices: [ 'On', 'Off', 'None' ]
+  batch_size:
+    description:
+    - Number of servers matched by each query.
+    type: int
+    default: 100
+  max_workers:
+    description:
+    - Maximum number of concurrent API calls.
+    type: int
+    default: 10
+author:
+- David Soper (@dsoper2)
+- CiscoUcs (@CiscoUcs)
+version_added: '2.8'
+'''
+
+EXAMPLES = r'''
+- name: Power off all servers in the play
+  intersight_server_actions:
+    api_private_key: "{{ api_private_key }}"
+    api_key_id: "{{ api_key_id }}"
+    servers: "{{ ansible_play_hosts | map('extract', hostvars, 'server_moid') | list }}"
+    power_state: PowerOff
+  delegate_to: localhost
+  run_once: true
+
+- name: Turn on the locator LED by server name
+  intersight_server_actions:
+    api_private_key: "{{ api_private_key }}"
+    api_key_id: "{{ api_key_id }}"
+    servers:
+      - SJC18-L14-UCS1-1
+      - SJC18-L14-UCS1-2
+    locator_state: 'On'
+'''
+
+RETURN = r'''
+servers:
+  description: Per server results.
+  returned: always
+  type: complex
+  contains:
+    Moid:
+      description: The Moid of the server.
+      returned: always
+      type: str
+      sample: 5978bea36ad4b000018d63dc
+    ServerSettings:
+      description: The Moid of the compute.ServerSetting object for the server.
+      returned: always
+      type: str
+      sample: 5978bea36ad4b000018d63dd
+    changed:
+      description: Whether the server settings were (or in check mode would be) updated.
+      returned: always
+      type: bool
+      sample: true
+'''
+
+from ansible.module_utils.remote_management.intersight import IntersightModule, intersight_argument_spec, compare_values, run_in_parallel, \
+    start_background_job
+from ansible.module_utils.basic import AnsibleModule
+
+
+def main():
+    argument_spec = intersight_argument_spec
+    argument_spec.update(
+        servers=dict(type='list', required=True),
+        power_state=dict(type='str', choices=['Policy', 'PowerOn', 'PowerOff', 'PowerCycle', 'HardReset', 'Shutdown', 'Reboot']),
+        locator_state=dict(type='str', choices=['On', 'Off', 'None']),
+        batch_size=dict(type='int', default=100),
+        max_workers=dict(type='int', default=10),
+    )
+
+    module = AnsibleModule(
+        argument_spec,
+        supports_check_mode=True,
+        required_one_of=[
+            ['power_state', 'locator_state'],
+        ],
+    )
+
+    start_background_job(module)
+
+    intersight = IntersightModule(module)
+    intersight.result['servers'] = []
+
+    api_body = {}
+    if module.params['power_state']:
+        api_body['AdminPowerState'] = module.params['power_state']
+    if module.params['locator_state']:
+        api_body['AdminLocatorLedState'] = module.params['locator_state']
+
+    batch_options = dict(batch_size=module.params['batch_size'], max_workers=module.params['max_workers'])
+    server_moids = intersight.get_server_moids(module.params['servers'], **batch_options)
+    settings = intersight.get_matching('/compute/ServerSettings', 'Server.Moid', server_moids, **batch_options)
+    settings_by_server = dict((setting['Server']['Moid'], setting) for setting in settings)
+    missing = [moid for moid in server_moids if moid not in settings_by_server]
+    if missing:
+        module.fail_json(msg="Server settings not found for servers: %s" % ', '.join(missing))
+
+    # only update servers whose current settings differ
+    update_list = []
+    for moid in server_moids:
+        setting = settings_by_server[moid]
+        changed = not compare_values(api_body, setting)
+        if changed:
+            update_list.append(setting['Moid'])
+        intersight.result['servers'].append(dict(Moid=moid, ServerSettings=setting['Moid'], changed=changed))
+    intersight.result['changed'] = bool(update_list)
+
+    if update_list and not module.check_mode:
+        def update_settings(settings_moid):
+            options = {
+                'http_method': 'patch',
+                'resource_path': '/compute/ServerSettings',
+                'body': api_body,
+                'moid': settings_moid,
+            }
+            return intersight.api_request(**options)
+
+        errors = []
+        for settings_moid, (dummy, error) in zip(update_list, run_in_parallel(update_settings, update_list, module.params['max_workers'])):
+            if error:
+                errors.append("%s: %s" % (settings_moid, str(error)))
+        if errors:
+            intersight.result['msg'] = "API error: %s " % '; '.join(errors)
+            module.fail_json(**intersight.result)
+
+    module.exit_json(**intersight.result)
+
+
+if __name__ == '__main__':
+    main()
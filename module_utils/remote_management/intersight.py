@@ -32,11 +32,22 @@
 
 from base64 import b64encode
 from email.utils import formatdate
+import fcntl
+import os
 import re
 import json
 import hashlib
+import tempfile
+import threading
+import time
+import zlib
+from ansible.module_utils.six import iteritems, string_types, BytesIO
+from ansible.module_utils.six.moves import intern, queue
 from ansible.module_utils.six.moves.urllib.parse import urlparse, urlencode, quote
+from ansible.module_utils.six.moves.urllib.request import getproxies, proxy_bypass
 from ansible.module_utils.urls import fetch_url
+from ansible.module_utils.connection import Connection
+from ansible.module_utils._text import to_bytes
 
 try:
     from cryptography.hazmat.primitives import serialization, hashes
@@ -46,14 +57,45 @@ try:
 except ImportError:
     HAS_CRYPTOGRAPHY = False
 
+try:
+    import urllib3
+    HAS_URLLIB3 = True
+except ImportError:
+    HAS_URLLIB3 = False
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+try:
+    import h2
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
 intersight_argument_spec = dict(
-    api_private_key=dict(type='path', required=True),
+    api_private_key=dict(type='path'),
     api_uri=dict(type='str', default='https://intersight.com/api/v1'),
-    api_key_id=dict(type='str', required=True),
+    api_key_id=dict(type='str'),
     validate_certs=dict(type='bool', default=True),
     use_proxy=dict(type='bool', default=True),
+    use_compression=dict(type='bool', default=True),
+    compact_json=dict(type='bool', default=False),
+    api_transport=dict(type='str', choices=['fetch_url', 'urllib3', 'httpx'], default='fetch_url'),
+    api_timeout=dict(type='int', default=10),
+    background=dict(type='bool', default=False),
+    job_dir=dict(type='path', default='~/.ansible/intersight_jobs'),
 )
 
+# options passed to the persistent httpapi connection with each request
+CONNECTION_OPTIONS = ['api_uri', 'api_private_key', 'api_key_id', 'validate_certs', 'use_proxy', 'use_compression', 'api_transport',
+                      'api_timeout']
+
+# options that can be set for each of the accounts
+ACCOUNT_OPTIONS = ['api_uri', 'api_key_id', 'api_private_key', 'validate_certs', 'use_proxy']
+
 
 def get_sha256_digest(data):
     """
@@ -102,18 +144,481 @@ def get_gmt_date():
     return formatdate(timeval=None, localtime=False, usegmt=True)
 
 
-class IntersightModule():
+def read_response(response, content_encoding=None, chunk_size=65536):
+    """
+    Read an HTTP response body, decompressing gzip or deflate content encoding as the body is read
+
+    :param response: file like object with the response body
+    :param content_encoding: value of the Content-Encoding response header
+    :param chunk_size: number of bytes read at a time
+    :return: decoded response body
+    """
+
+    encoding = (content_encoding or '').lower()
+    if encoding not in ('gzip', 'deflate'):
+        return response.read()
+
+    data = []
+    decompressor = None
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        if decompressor is None:
+            if chunk[:1] in (b'{', b'['):
+                # body was already decoded by the HTTP library
+                return chunk + response.read()
+            if encoding == 'gzip':
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            elif (ord(chunk[:1]) & 0x0f) == 8:
+                # zlib wrapped deflate data
+                decompressor = zlib.decompressobj()
+            else:
+                # raw deflate data sent by some servers
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        data.append(decompressor.decompress(chunk))
+    if decompressor is not None:
+        data.append(decompressor.flush())
+    return b''.join(data)
+
+
+def load_json_file(path):
+    """
+    Load a JSON document saved by a previous module run
+
+    :param path: filename of the JSON document
+    :return: decoded JSON data or None if the file is missing or unreadable
+    """
+
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_json_file(path, data):
+    """
+    Atomically replace a JSON document so concurrent readers never see a partial file
+
+    :param path: filename of the JSON document
+    :param data: JSON serializable data
+    """
+
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.intersight-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def is_moid(value):
+    """
+    Check if a value looks like an Intersight object moid
+
+    :param value: string to check
+    :return: True for a 24 character hex string
+    """
+
+    return bool(re.match(r'^[0-9a-f]{24}$', str(value)))
+
+
+def get_in_filter(field, values):
+    """
+    Build an Intersight query filter matching any of several values
+
+    :param field: object property e.g. 'Server.Moid'
+    :param values: list of string values
+    :return: filter string e.g. "Server.Moid in ('a','b')"
+    """
+
+    return "%s in (%s)" % (field, ','.join("'%s'" % value for value in values))
+
+
+def chunks(items, size):
+    """
+    Split a list into batches
+
+    :param items: list to split
+    :param size: maximum batch size
+    :return: generator of lists
+    """
+
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def compare_lists(expected_list, actual_list):
+    if len(expected_list) != len(actual_list):
+        # mismatch if list lengths aren't equal
+        return False
+    for expected, actual in zip(expected_list, actual_list):
+        # if compare_values returns False, stop the loop and return
+        if not compare_values(expected, actual):
+            return False
+    # loop complete with all items matching
+    return True
+
+
+def compare_values(expected, actual):
+    try:
+        if isinstance(expected, list) and isinstance(actual, list):
+            return compare_lists(expected, actual)
+        for (key, value) in iteritems(expected):
+            if re.search(r'P(ass)?w(or)?d', key) or key not in actual:
+                # do not compare any password related attributes or attributes that are not in the actual resource
+                continue
+            if not compare_values(value, actual[key]):
+                return False
+        # loop complete with all items matching
+        return True
+    except (AttributeError, TypeError):
+        # if expected and actual != expected:
+        if actual != expected:
+            return False
+        return True
+
+
+# ownership and audit metadata dropped from compact records
+COMPACT_DROP_FIELDS = frozenset([
+    'AccountMoid', 'Ancestors', 'ClassId', 'CreateTime', 'DomainGroupMoid', 'Owners', 'PermissionResources', 'SharedScope',
+])
+
+# marks record fields that are not set
+_ABSENT = object()
+
+# record classes by ObjectType
+RECORD_CLASSES = {}
+
+
+class CompactRecord(object):
+    '''
+    Base class of the compact records created for each ObjectType by compact_value
+    Fields seen in the first object of an ObjectType are stored in __slots__ and any other fields in a dict
+    Records support the dict methods used by the modules and are converted back to dicts with expand_value
+    '''
+
+    __slots__ = ('_extra',)
+    _fields = ()
+    _field_set = frozenset()
+
+    def __init__(self, obj):
+        extra = None
+        for key in self._fields:
+            setattr(self, key, obj.get(key, _ABSENT))
+        for key, value in iteritems(obj):
+            if key not in self._field_set:
+                if extra is None:
+                    extra = {}
+                extra[intern_value(key)] = value
+        self._extra = extra
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            value = getattr(self, key)
+            if value is not _ABSENT:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = [key for key in self._fields if getattr(self, key) is not _ABSENT]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+
+def get_record_class(object_type, obj):
+    record_class = RECORD_CLASSES.get(object_type)
+    if record_class is None:
+        # slots can only hold field names that are identifiers and do not shadow the record methods
+        fields = tuple(intern_value(key) for key in obj if re.match(r'[A-Z][A-Za-z0-9_]*$', key))
+        record_class = type(str(object_type.replace('.', '_')), (CompactRecord,), dict(
+            __slots__=fields,
+            _fields=fields,
+            _field_set=frozenset(fields),
+        ))
+        record_class = RECORD_CLASSES.setdefault(object_type, record_class)
+    return record_class
+
+
+def intern_value(value):
+    if isinstance(value, str) and len(value) <= 64:
+        return intern(value)
+    return value
+
+
+def compact_value(value):
+    """
+    Return a compact copy of an API object or value
+    Dicts with an ObjectType become records of their ObjectType without the audit metadata, other dict keys and
+    short strings are interned so repeated values are stored once
+
+    :param value: decoded JSON value
+    :return: compact value
+    """
+
+    if isinstance(value, dict):
+        obj = dict(
+            (intern_value(key), compact_value(item))
+            for (key, item) in iteritems(value)
+            if key not in COMPACT_DROP_FIELDS
+        )
+        object_type = value.get('ObjectType')
+        if isinstance(object_type, string_types):
+            return get_record_class(object_type, obj)(obj)
+        return obj
+    if isinstance(value, list):
+        return [compact_value(item) for item in value]
+    return intern_value(value)
+
+
+def expand_value(value):
+    """
+    Convert compact records (and records nested in lists and dicts) back to dicts, e.g. for module results
+
+    :param value: value that may contain records
+    :return: value with plain dicts and lists
+    """
+
+    if isinstance(value, (CompactRecord, dict)):
+        return dict((key, expand_value(item)) for (key, item) in value.items())
+    if isinstance(value, list):
+        return [expand_value(item) for item in value]
+    return value
+
+
+def run_in_parallel(func, items, max_workers=10):
+    """
+    Call a function for each item using a bounded pool of worker threads
+
+    :param func: callable run with each item
+    :param items: list of items
+    :param max_workers: maximum number of concurrent calls
+    :return: list of (result, exception) tuples in the same order as items
+    """
+
+    items = list(items)
+    results = [None] * len(items)
+    work = queue.Queue()
+    for index, item in enumerate(items):
+        work.put((index, item))
+
+    def worker():
+        while True:
+            try:
+                index, item = work.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[index] = (func(item), None)
+            except Exception as e:
+                results[index] = (None, e)
+
+    threads = [threading.Thread(target=worker) for dummy in range(min(max_workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def run_dependency_graph(func, dependencies, max_workers=10):
+    """
+    Call a function for each node of a dependency graph using a bounded pool of worker threads
+    A node is started as soon as all of its dependencies have completed successfully
+
+    :param func: callable run with a node key and a dict of dependency keys to their results
+    :param dependencies: dict of node keys to lists of keys the node depends on (must not contain cycles)
+    :param max_workers: maximum number of concurrent calls
+    :return: dict of node keys to (result, exception) tuples
+    """
+
+    results = {}
+    waiting = dict((key, set(deps)) for key, deps in iteritems(dependencies))
+    work = queue.Queue()
+    done = queue.Queue()
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            key, dep_results = item
+            try:
+                done.put((key, func(key, dep_results), None))
+            except Exception as e:
+                done.put((key, None, e))
+
+    def skip_dependents(failed_key):
+        for key in [key for key, deps in iteritems(waiting) if failed_key in deps]:
+            del waiting[key]
+            results[key] = (None, RuntimeError('dependency %s failed' % failed_key))
+            skip_dependents(key)
+
+    threads = [threading.Thread(target=worker) for dummy in range(max(1, min(max_workers, len(dependencies))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    running = 0
+    while True:
+        for key in [key for key, deps in iteritems(waiting) if not deps]:
+            del waiting[key]
+            work.put((key, dict((dep, results[dep][0]) for dep in dependencies[key])))
+            running += 1
+        if not running:
+            break
+        key, result, error = done.get()
+        running -= 1
+        results[key] = (result, error)
+        if error:
+            skip_dependents(key)
+        else:
+            for deps in waiting.values():
+                deps.discard(key)
+
+    for thread in threads:
+        work.put(None)
+
+    return results
+
+
+class FetchUrlTransport():
+    """
+    HTTP transport using the Ansible fetch_url function (a new connection for each request)
+    """
 
     def __init__(self, module):
         self.module = module
-        self.result = dict(changed=False)
-        if not HAS_CRYPTOGRAPHY:
-            self.module.fail_json(msg='cryptography is required for this module')
-        self.host = self.module.params['api_uri']
-        self.public_key = self.module.params['api_key_id']
-        self.private_key = open(self.module.params['api_private_key'], 'r').read()
+
+    def request(self, method, url, body, headers):
+        return fetch_url(self.module, url, data=body, headers=headers, method=method,
+                         use_proxy=self.module.params['use_proxy'], timeout=self.module.params['api_timeout'])
+
+
+class Urllib3Transport():
+    """
+    HTTP transport using a urllib3 connection pool shared by all requests (and worker threads) of the module
+    """
+
+    def __init__(self, module):
+        self.module = module
+        if not HAS_URLLIB3:
+            self.module.fail_json(msg='urllib3 is required for api_transport urllib3')
+        pool_options = dict(
+            maxsize=max(10, module.params.get('max_workers') or 0),
+            cert_reqs='CERT_REQUIRED' if module.params['validate_certs'] else 'CERT_NONE',
+            retries=False,
+        )
+        if not module.params['validate_certs']:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        proxy = getproxies().get('https') if module.params['use_proxy'] else None
+        if proxy and not proxy_bypass(urlparse(module.params['api_uri']).hostname):
+            self.pool = urllib3.ProxyManager(proxy, **pool_options)
+        else:
+            self.pool = urllib3.PoolManager(**pool_options)
+
+    def request(self, method, url, body, headers):
+        try:
+            response = self.pool.request(method, url, body=body.encode('utf-8'), headers=headers, preload_content=False,
+                                         decode_content=False, timeout=self.module.params['api_timeout'])
+        except urllib3.exceptions.HTTPError as e:
+            return None, dict(status=-1, msg='Request failed: %s' % str(e), url=url)
+        info = dict((key.lower(), value) for key, value in response.headers.items())
+        info.update(status=response.status, msg='OK' if response.status < 400 else response.reason, url=url)
+        if response.status >= 400:
+            info['body'] = response.read()
+        return response, info
+
+
+class HttpxTransport():
+    """
+    HTTP transport using an httpx client, with HTTP/2 multiplexing when the h2 package is installed
+    """
+
+    def __init__(self, module):
+        self.module = module
+        if not HAS_HTTPX:
+            self.module.fail_json(msg='httpx is required for api_transport httpx')
+        self.client = httpx.Client(
+            http2=HAS_H2,
+            verify=module.params['validate_certs'],
+            trust_env=module.params['use_proxy'],
+            timeout=module.params['api_timeout'],
+            limits=httpx.Limits(max_connections=max(10, module.params.get('max_workers') or 0)),
+        )
+
+    def request(self, method, url, body, headers):
+        try:
+            response = self.client.send(self.client.build_request(method, url, content=body.encode('utf-8'), headers=headers), stream=True)
+            # read the raw body so content encoding is handled the same way for all transports
+            data = b''.join(response.iter_raw())
+            response.close()
+        except httpx.HTTPError as e:
+            return None, dict(status=-1, msg='Request failed: %s' % str(e), url=url)
+        info = dict((key.lower(), value) for key, value in response.headers.items())
+        info.update(status=response.status_code, msg='OK' if response.status_code < 400 else response.reason_phrase, url=url,
+                    http_version=response.http_version)
+        if response.status_code >= 400:
+            info['body'] = data
+        return BytesIO(data), info
+
+
+TRANSPORTS = {
+    'fetch_url': FetchUrlTransport,
+    'urllib3': Urllib3Transport,
+    'httpx': HttpxTransport,
+}
+
+
+class IntersightSigner():
+    """
+    Signs Intersight API requests with an API key
+    """
+
+    def __init__(self, public_key, private_key):
+        self.public_key = public_key
+        self.private_key = private_key
+        self.rsakey = None
         self.digest_algorithm = 'rsa-sha256'
-        self.response_list = []
 
     def get_rsasig_b64encode(self, data):
         """
@@ -123,8 +628,10 @@ class IntersightModule():
         :return: instance of digest object
         """
 
-        rsakey = serialization.load_pem_private_key(self.private_key.encode(), None, default_backend())
-        sign = rsakey.sign(data.encode(), padding.PKCS1v15(), hashes.SHA256())
+        if self.rsakey is None:
+            # parsing (and validating) the PEM key costs far more than signing, so only do it once
+            self.rsakey = serialization.load_pem_private_key(self.private_key.encode(), None, default_backend())
+        sign = self.rsakey.sign(data.encode(), padding.PKCS1v15(), hashes.SHA256())
 
         return b64encode(sign)
 
@@ -149,6 +656,345 @@ class IntersightModule():
 
         return auth_str
 
+    def get_request_header(self, request_target, target_host, body_string):
+        """
+        Generates the signed HTTP request header
+
+        :param request_target: http method plus endpoint
+        :param target_host: host (and optional port) of the API endpoint
+        :param body_string: request body sent
+        :return: dict with request headers
+        """
+
+        # Get the current GMT Date/Time
+        cdate = get_gmt_date()
+
+        # Generate the body digest
+        body_digest = get_sha256_digest(body_string)
+        b64_body_digest = b64encode(body_digest.digest())
+
+        # Generate the authorization header
+        auth_header = {
+            'Date': cdate,
+            'Host': target_host,
+            'Digest': "SHA-256=" + b64_body_digest.decode('ascii')
+        }
+
+        string_to_sign = prepare_str_to_sign(request_target, auth_header)
+        b64_signed_msg = self.get_rsasig_b64encode(string_to_sign)
+        auth_header = self.get_auth_header(auth_header, b64_signed_msg)
+
+        # Generate the HTTP requests header
+        return {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'Host': '{0}'.format(target_host),
+            'Date': '{0}'.format(cdate),
+            'Digest': 'SHA-256={0}'.format(b64_body_digest.decode('ascii')),
+            'Authorization': '{0}'.format(auth_header),
+        }
+
+
+class Ledger():
+    '''
+    Local record of applied api_body hashes with the Moid, ModTime, and state of the configured objects
+    An unchanged api_body can then be skipped without an API call, or confirmed with a ModTime only query
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = (load_json_file(path) or {}).get('objects') or {}
+        self.updates = {}
+
+    @staticmethod
+    def get_key(api_uri, api_key_id, resource_path, query_params):
+        """
+        Ledger key of an object, which is identified by the account and the query used to find it
+        The api_key_id separates accounts that share an api_uri (e.g., all intersight.com accounts)
+        """
+
+        return get_sha256_digest(json.dumps([api_uri, api_key_id, resource_path, query_params], sort_keys=True)).hexdigest()
+
+    @staticmethod
+    def get_body_hash(api_body):
+        return get_sha256_digest(json.dumps(api_body, sort_keys=True)).hexdigest()
+
+    def lookup(self, key, api_body):
+        """
+        Return the ledger entry of an object if it was last configured with the same api_body
+
+        :return: dict with Moid, ModTime, and api_response, or None
+        """
+
+        entry = self.entries.get(key)
+        if entry and entry.get('body_hash') == self.get_body_hash(api_body):
+            return entry
+        return None
+
+    def record(self, key, api_body, api_response):
+        entry = dict(
+            body_hash=self.get_body_hash(api_body),
+            Moid=api_response.get('Moid'),
+            ModTime=api_response.get('ModTime'),
+            api_response=api_response,
+        )
+        self.entries[key] = self.updates[key] = entry
+
+    def forget(self, key):
+        self.entries.pop(key, None)
+        self.updates[key] = None
+
+    def verify(self, intersight, resource_path, entries, batch_size=100):
+        """
+        Check that objects were not changed since they were recorded with batched ModTime only queries
+
+        :param entries: dict of key to ledger entry
+        :return: list of keys whose objects still have the recorded ModTime
+        """
+
+        moids = [entry['Moid'] for entry in entries.values() if entry.get('Moid')]
+        if not moids:
+            return []
+        mod_times = dict(
+            (obj['Moid'], obj.get('ModTime'))
+            for obj in intersight.get_matching(resource_path, 'Moid', moids, select='ModTime', batch_size=batch_size)
+        )
+        return [key for (key, entry) in iteritems(entries) if entry.get('ModTime') and mod_times.get(entry['Moid']) == entry['ModTime']]
+
+    def save(self):
+        """
+        Merge the updates of this run into the ledger file
+        The file is locked and reloaded so concurrent module runs do not lose each other's updates
+        """
+
+        if not self.updates:
+            return
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = (load_json_file(self.path) or {}).get('objects') or {}
+                for key, entry in iteritems(self.updates):
+                    if entry is None:
+                        entries.pop(key, None)
+                    else:
+                        entries[key] = entry
+                write_json_file(self.path, dict(objects=entries))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.updates = {}
+
+
+class BackgroundJob():
+    '''
+    Job file of a module running in a background worker with the job status, progress, and module result
+    '''
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self.lock = threading.Lock()
+        self.last_write = 0
+        self.write()
+
+    def write(self):
+        self.last_write = time.time()
+        write_json_file(self.path, self.data)
+
+    def update(self, **progress):
+        """
+        Merge progress values into the job file, writing at most once a second
+        """
+
+        with self.lock:
+            self.data['progress'].update(progress)
+            if time.time() - self.last_write >= 1:
+                self.write()
+
+    def add_api_call(self):
+        with self.lock:
+            self.data['progress']['api_calls'] = self.data['progress'].get('api_calls', 0) + 1
+            if time.time() - self.last_write >= 1:
+                self.write()
+
+    def finish(self, result):
+        with self.lock:
+            self.data['status'] = 'failed' if result.get('failed') else 'finished'
+            self.data['finished'] = time.time()
+            self.data['result'] = result
+            self.write()
+
+
+def start_background_job(module):
+    '''
+    If the background option is set, run the rest of the module in a detached worker process and exit with the job id
+    The worker writes progress and the module result to a job file in job_dir (see the intersight_job_status module)
+
+    :param module: AnsibleModule
+    '''
+    if not module.params['background']:
+        return
+    job_dir = module.params['job_dir']
+    if not os.path.isdir(job_dir):
+        os.makedirs(job_dir)
+    job_id = '%d.%d' % (int(time.time()), os.getpid())
+    job_file = os.path.join(job_dir, job_id + '.json')
+    data = dict(job_id=job_id, module=getattr(module, '_name', None), status='running', started=time.time(), pid=None, progress={})
+    write_json_file(job_file, data)
+
+    pid = os.fork()
+    if pid:
+        # the first child exits as soon as the worker is started
+        os.waitpid(pid, 0)
+        module.exit_json(changed=False, job_id=job_id, job_file=job_file)
+
+    # detach the worker from the module output and the controlling session
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in [0, 1, 2]:
+        os.dup2(devnull, fd)
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+
+    data['pid'] = os.getpid()
+    job = BackgroundJob(job_file, data)
+    module.intersight_job = job
+
+    def finish(**kwargs):
+        job.finish(kwargs)
+        os._exit(0)
+
+    def fail(msg, **kwargs):
+        kwargs['failed'] = True
+        kwargs['msg'] = msg
+        finish(**kwargs)
+
+    module.exit_json = finish
+    module.fail_json = fail
+
+
+def report_progress(module, **progress):
+    '''
+    Record progress values in the job file when the module is running in the background
+    '''
+    job = getattr(module, 'intersight_job', None)
+    if job is not None:
+        job.update(**progress)
+
+
+class AccountError(Exception):
+    '''
+    Failure of one of the accounts, with the other fail_json values (e.g., changed and per object results)
+    '''
+
+    def __init__(self, msg, result=None):
+        super(AccountError, self).__init__(msg)
+        self.result = result or {}
+
+
+class AccountModule():
+    '''
+    Stand-in for AnsibleModule with the API options of one of the accounts
+    fail_json raises AccountError so one account can fail without exiting the module
+    '''
+
+    def __init__(self, module, account):
+        self._module = module
+        self.params = dict(module.params)
+        for key in ACCOUNT_OPTIONS:
+            if account.get(key) is not None:
+                self.params[key] = account[key]
+        if account.get('api_private_key'):
+            self.params['api_private_key'] = os.path.expanduser(account['api_private_key'])
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def fail_json(self, msg, **kwargs):
+        raise AccountError(msg, kwargs)
+
+
+def run_for_accounts(module, func, max_workers=10):
+    '''
+    Run func(intersight) concurrently for each of the accounts in the accounts module option
+    func updates intersight.result and may call intersight.module.fail_json to fail the account
+
+    :param module: AnsibleModule
+    :param func: function called with the IntersightModule of each account
+    :param max_workers: maximum number of accounts processed at once
+    :return: list of account results tagged with the account name and api_uri
+    '''
+    accounts = module.params['accounts']
+    names = set()
+    for account in accounts:
+        if not isinstance(account, dict):
+            module.fail_json(msg="Each account must be a dict")
+        for required in ['name', 'api_key_id', 'api_private_key']:
+            if not account.get(required):
+                module.fail_json(msg="%s is required for each account" % required)
+        if account['name'] in names:
+            module.fail_json(msg="Duplicate account name %s" % account['name'])
+        names.add(account['name'])
+
+    def run(account):
+        intersight = IntersightModule(AccountModule(module, account))
+        func(intersight)
+        return intersight.result
+
+    account_results = []
+    for account, (result, error) in zip(accounts, run_in_parallel(run, accounts, max_workers)):
+        if error:
+            result = dict(changed=False)
+            if isinstance(error, AccountError):
+                result.update(error.result)
+            result.update(failed=True, msg=str(error))
+        account_result = dict(name=account['name'], api_uri=account.get('api_uri') or module.params['api_uri'])
+        account_result.update(result)
+        account_results.append(account_result)
+    return account_results
+
+
+class IntersightModule():
+
+    def __init__(self, module):
+        self.module = module
+        self.result = dict(changed=False)
+        if not HAS_CRYPTOGRAPHY:
+            self.module.fail_json(msg='cryptography is required for this module')
+        if not self.module.params['api_key_id'] or not self.module.params['api_private_key']:
+            self.module.fail_json(msg='api_key_id and api_private_key are required')
+        self.host = self.module.params['api_uri']
+        self.public_key = self.module.params['api_key_id']
+        self.response_list = []
+        self.connection = None
+        if getattr(self.module, '_socket_path', None):
+            # signing and HTTP connections are handled by the persistent intersight httpapi connection
+            self.connection = Connection(self.module._socket_path)
+        else:
+            self.private_key = open(self.module.params['api_private_key'], 'r').read()
+            self.signer = IntersightSigner(self.public_key, self.private_key)
+            self.transport = TRANSPORTS[self.module.params['api_transport']](self.module)
+
+    def get_rsasig_b64encode(self, data):
+        """
+        Generates an RSA Signed SHA256 digest from a String
+
+        :param digest: string to be signed & hashed
+        :return: instance of digest object
+        """
+
+        return self.signer.get_rsasig_b64encode(data)
+
+    def get_auth_header(self, hdrs, signed_msg):
+        """
+        Assmebled an Intersight formatted authorization header
+
+        :param hdrs : object with header keys
+        :param signed_msg: base64 encoded sha256 hashed body
+        :return: concatenated authorization header
+        """
+
+        return self.signer.get_auth_header(hdrs, signed_msg)
+
     def get_moid_by_name(self, resource_path, target_name):
         """
         Retrieve an Intersight object moid by name
@@ -167,36 +1013,170 @@ class IntersightModule():
             "query_params": query_params
         }
 
-        get_moid = self.intersight_call(**options)
+        if self.connection is not None:
+            # name lookups are cached by the persistent connection
+            return self.connection.get_moid_by_name(self.get_connection_options(), self.host, resource_path, target_name)
+
+        get_moid = self.api_request(**options)
 
-        if get_moid.json()['Results'] is not None:
-            located_moid = get_moid.json()['Results'][0]['Moid']
+        if get_moid.get('Results'):
+            located_moid = get_moid['Results'][0]['Moid']
         else:
             raise KeyError('Intersight object with name "{0}" not found!'.format(target_name))
 
         return located_moid
 
-    def call_api(self, **options):
+    def get_connection_options(self):
         """
-        Call the Intersight API and check for success status
+        Module options used by the persistent connection to sign and send requests
+
+        :return: dict of option names and values
+        """
+
+        return dict((key, self.module.params[key]) for key in CONNECTION_OPTIONS)
+
+    def api_request(self, **options):
+        """
+        Call the Intersight API and raise an exception for an unsuccessful status
+        Safe to use from worker threads since the module is not exited on errors
         :param options: options dict with method and other params for API call
         :return: json http response object
         """
 
-        try:
-            response, info = self.intersight_call(**options)
-            if not re.match(r'2..', str(info['status'])):
-                raise RuntimeError(info['status'], info['msg'], info['body'])
-        except Exception as e:
-            self.module.fail_json(msg="API error: %s " % str(e))
+        response, info = self.intersight_call(**options)
+        job = getattr(self.module, 'intersight_job', None)
+        if job is not None:
+            job.add_api_call()
+        if not re.match(r'2..', str(info['status'])):
+            body = info.get('body')
+            if isinstance(body, bytes):
+                body = read_response(BytesIO(body), info.get('content-encoding'))
+            raise RuntimeError(info['status'], info['msg'], body)
 
-        response_data = response.read()
+        response_data = read_response(response, info.get('content-encoding'))
         if len(response_data) > 0:
             resp_json = json.loads(response_data)
             resp_json['trace_id'] = info.get('x-starship-traceid')
             return resp_json
         return {}
 
+    def call_api(self, **options):
+        """
+        Call the Intersight API and check for success status
+        :param options: options dict with method and other params for API call
+        :return: json http response object
+        """
+
+        try:
+            return self.api_request(**options)
+        except Exception as e:
+            self.module.fail_json(msg="API error: %s " % str(e))
+
+    def get_pages(self, resource_path, query_params=None, page_size=1000, fail_on_error=True):
+        """
+        Page through an Intersight collection with $top/$skip
+        Pages are ordered by Moid unless query_params has an $orderby, so objects are not skipped or repeated
+        when the collection is not returned in a stable order
+
+        :param resource_path: intersight resource path e.g. '/compute/PhysicalSummaries'
+        :param query_params: dictionary object with query string parameters (e.g., $filter, $select)
+        :param page_size: number of objects requested per API call
+        :param fail_on_error: if False, raise API errors instead of failing the module (for use in worker threads)
+        :return: generator of Results lists, one per page
+        """
+
+        params = dict(query_params or {})
+        params.setdefault('$orderby', 'Moid')
+        params['$top'] = page_size
+        skip = 0
+        while True:
+            params['$skip'] = skip
+            options = {
+                'http_method': 'get',
+                'resource_path': resource_path,
+                'query_params': params,
+            }
+            if fail_on_error:
+                results = self.call_api(**options).get('Results') or []
+            else:
+                results = self.api_request(**options).get('Results') or []
+            if results:
+                yield results
+            if len(results) < page_size:
+                break
+            skip += page_size
+
+    def get_matching(self, resource_path, field, values, select=None, batch_size=100, max_workers=10, query_params=None):
+        """
+        GET all objects whose field matches one of several values using batched "in" queries run concurrently
+
+        :param resource_path: intersight resource path e.g. '/compute/ServerSettings'
+        :param field: object property matched e.g. 'Server.Moid'
+        :param values: list of values to match
+        :param select: optional $select projection
+        :param batch_size: number of values in each query
+        :param max_workers: maximum number of concurrent API calls
+        :param query_params: optional additional query string parameters (e.g., $expand)
+        :return: list of matching objects
+        """
+
+        def get_batch(batch):
+            params = dict(query_params or {})
+            params['$filter'] = get_in_filter(field, batch)
+            params['$top'] = batch_size
+            if select:
+                params['$select'] = select
+            options = {
+                'http_method': 'get',
+                'resource_path': resource_path,
+                'query_params': params,
+            }
+            return self.api_request(**options).get('Results') or []
+
+        objects = []
+        for results, error in run_in_parallel(get_batch, list(chunks(values, batch_size)), max_workers):
+            if error:
+                self.module.fail_json(msg="API error: %s " % str(error))
+            objects.extend(results)
+        return objects
+
+    def get_server_moids(self, servers, batch_size=100, max_workers=10):
+        """
+        Resolve a list of server Moids or names to server Moids
+
+        :param servers: list of server Moids or server names
+        :param batch_size: number of names in each lookup query
+        :param max_workers: maximum number of concurrent API calls
+        :return: list of unique server Moids in the requested order
+        """
+
+        moids = []
+        names = []
+        for server in servers:
+            if is_moid(server):
+                moids.append(server)
+            else:
+                names.append(server)
+        if names:
+            if self.connection is not None:
+                # name lookups are cached by the persistent connection
+                found = self.connection.get_moids_by_name(self.get_connection_options(), self.host, '/compute/PhysicalSummaries', names,
+                                                          batch_size)
+            else:
+                summaries = self.get_matching('/compute/PhysicalSummaries', 'Name', names, select='Name', batch_size=batch_size,
+                                              max_workers=max_workers)
+                found = dict((summary['Name'], summary['Moid']) for summary in summaries)
+            missing = [name for name in names if name not in found]
+            if missing:
+                self.module.fail_json(msg="Servers not found: %s" % ', '.join(missing))
+            moids.extend(found[name] for name in names)
+        # remove duplicates while keeping the requested order
+        unique_moids = []
+        for moid in moids:
+            if moid not in unique_moids:
+                unique_moids.append(moid)
+        return unique_moids
+
     def intersight_call(self, http_method="", resource_path="", query_params=None, body=None, moid=None, name=None):
         """
         Invoke the Intersight API
@@ -256,40 +1236,24 @@ class IntersightModule():
 
         # Check for GET request to properly form body
         if method != "GET":
-            bodyString = json.dumps(body)
+            if self.module.params['compact_json']:
+                # the digest is computed on the exact string sent, so whitespace can be dropped
+                bodyString = json.dumps(body, separators=(',', ':'))
+            else:
+                bodyString = json.dumps(body)
 
         # Concatenate URLs for headers
         target_url = self.host + resource_path + query_path
         request_target = method + " " + target_path + resource_path + query_path
 
-        # Get the current GMT Date/Time
-        cdate = get_gmt_date()
+        if self.connection is not None:
+            info, data = self.connection.intersight_request(self.get_connection_options(), method, target_url, request_target, bodyString)
+            return BytesIO(to_bytes(data)), info
 
-        # Generate the body digest
-        body_digest = get_sha256_digest(bodyString)
-        b64_body_digest = b64encode(body_digest.digest())
-
-        # Generate the authorization header
-        auth_header = {
-            'Date': cdate,
-            'Host': target_host,
-            'Digest': "SHA-256=" + b64_body_digest.decode('ascii')
-        }
-
-        string_to_sign = prepare_str_to_sign(request_target, auth_header)
-        b64_signed_msg = self.get_rsasig_b64encode(string_to_sign)
-        auth_header = self.get_auth_header(auth_header, b64_signed_msg)
-
-        # Generate the HTTP requests header
-        request_header = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'Host': '{0}'.format(target_host),
-            'Date': '{0}'.format(cdate),
-            'Digest': 'SHA-256={0}'.format(b64_body_digest.decode('ascii')),
-            'Authorization': '{0}'.format(auth_header),
-        }
+        request_header = self.signer.get_request_header(request_target, target_host, bodyString)
+        if self.module.params['use_compression']:
+            request_header['Accept-Encoding'] = 'gzip, deflate'
 
-        response, info = fetch_url(self.module, target_url, data=bodyString, headers=request_header, method=method, use_proxy=self.module.params['use_proxy'])
+        response, info = self.transport.request(method, target_url, bodyString, request_header)
 
         return response, info
@@ -20,8 +20,8 @@ options:
   api_private_key:
     description:
     - 'Filename (absolute path) of a PEM formatted file that contains your private key to be used for Intersight API authentication.'
+    - Required unless I(accounts) is used by the module.
     type: path
-    required: yes
   api_uri:
     description:
     - URI used to access the Intersight API.
@@ -30,8 +30,8 @@ options:
   api_key_id:
     description:
     - Public API Key ID associated with the private key.
+    - Required unless I(accounts) is used by the module.
     type: str
-    required: yes
   validate_certs:
     description:
     - Boolean control for verifying the api_uri TLS certificate
@@ -42,4 +42,59 @@ options:
     - If C(no), it will not use a proxy, even if one is defined in an environment variable on the target hosts.
     type: bool
     default: yes
+  use_compression:
+    description:
+    - If C(yes), gzip or deflate compressed responses are requested and decoded.
+    - Large collection GETs are much smaller on the wire when compressed.
+    type: bool
+    default: yes
+  compact_json:
+    description:
+    - If C(yes), request bodies are serialized without whitespace.
+    type: bool
+    default: no
+  api_transport:
+    description:
+    - HTTP library used for API requests.
+    - C(fetch_url) uses the Ansible URL functions and opens a new connection for each request.
+    - C(urllib3) keeps a pool of connections that is reused by all requests of the module (requires urllib3).
+    - C(httpx) keeps a pool of connections and uses HTTP/2 if the h2 package is installed (requires httpx).
+    type: str
+    choices: [ fetch_url, urllib3, httpx ]
+    default: fetch_url
+  api_timeout:
+    description:
+    - Timeout in seconds for each API request.
+    type: int
+    default: 10
+  background:
+    description:
+    - If C(yes), the module returns a I(job_id) right away and its work is done by a detached background worker.
+    - The worker writes its progress (e.g., the number of API calls made) and the module result to a job file in I(job_dir).
+    - Use M(intersight_job_status) to check on or wait for the job.
+    type: bool
+    default: no
+  job_dir:
+    description:
+    - Directory of the job files of background modules.
+    type: path
+    default: ~/.ansible/intersight_jobs
+'''
+
+    # Multiple account options, used with the intersight fragment
+    ACCOUNTS = '''
+options:
+  accounts:
+    description:
+    - List of Intersight accounts (or appliances) the module is run against instead of the single account given by
+      I(api_uri), I(api_key_id), and I(api_private_key).
+    - The accounts are processed concurrently, each with its own API key and connections.
+    - 'Each account has the following:'
+    - '- name: Name used to tag the results of the account.'
+    - '- api_key_id: Public API Key ID of the account.'
+    - '- api_private_key: Filename of the private key of the account.'
+    - '- api_uri: Optional URI of the account API.  Defaults to I(api_uri).'
+    - '- validate_certs, use_proxy: Optional, default to the module options.'
+    - Results are returned in I(intersight_accounts) and the module fails if any account fails.
+    type: list
 '''
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+author:
+- David Soper (@dsoper2)
+- CiscoUcs (@CiscoUcs)
+httpapi: intersight
+short_description: HttpApi Plugin for Cisco Intersight
+description:
+- Keeps Cisco Intersight API state in the long lived ansible-connection process so it is shared by all tasks
+  that use the connection.
+- Parsed API keys, HTTP connection pools (see the I(api_transport) module option), and name to Moid lookups are
+  reused across tasks instead of being recreated by every module run.
+- Name to Moid lookups are cached per API key for server names given to modules such as
+  intersight_server_actions and intersight_firmware_upgrade, and for objects updated or deleted by name.
+  The cache is cleared after any request that may change objects.
+- An I(api_transport) of C(fetch_url) is replaced by the pooled C(urllib3) (or C(httpx)) transport, so urllib3 or httpx is required.
+- The intersight_rest_api, intersight_facts, and other modules using the Intersight module_utils send their API calls
+  through this plugin when run with C(ansible_connection=httpapi) and C(ansible_network_os=intersight).
+- The API endpoint and key are still given by the module options (api_uri, api_key_id, api_private_key).
+- Requests from one task are sent one at a time by the persistent connection, so modules that send concurrent requests
+  are serialized.
+- The intersight_objects module uses the Intersight Python SDK and does not use this plugin.
+version_added: "2.8"
+'''
+
+EXAMPLES = r'''
+# inventory
+# [Intersight:vars]
+# ansible_connection=httpapi
+# ansible_network_os=intersight
+# ansible_host=intersight.com
+#
+# The plugin is found with ANSIBLE_HTTPAPI_PLUGINS=./plugins/httpapi (or httpapi_plugins in ansible.cfg)
+'''
+
+import json
+import os
+from ansible.module_utils.connection import ConnectionError
+from ansible.module_utils.remote_management.intersight import IntersightSigner, TRANSPORTS, HAS_HTTPX, HAS_URLLIB3, chunks, get_in_filter, \
+    read_response
+from ansible.module_utils.six import BytesIO, integer_types, string_types
+from ansible.module_utils.six.moves.urllib.parse import urlparse, urlencode
+from ansible.module_utils._text import to_text
+from ansible.plugins.httpapi import HttpApiBase
+
+
+class ConnectionModule():
+    '''
+    Minimal stand-in for AnsibleModule so module_utils transports can be used by the connection process
+    '''
+
+    def __init__(self, params):
+        self.params = params
+
+    def fail_json(self, msg, **kwargs):
+        raise ConnectionError(msg)
+
+
+class HttpApi(HttpApiBase):
+
+    def __init__(self, *args, **kwargs):
+        super(HttpApi, self).__init__(*args, **kwargs)
+        self.signers = {}
+        self.transports = {}
+        self.moid_cache = {}
+
+    def get_signer(self, options):
+        '''
+        Return a signer for the API key, reloading the private key only when the key file changes
+        '''
+        key_path = os.path.expanduser(options['api_private_key'])
+        cache_key = (options['api_key_id'], key_path, os.path.getmtime(key_path))
+        if cache_key not in self.signers:
+            with open(key_path, 'r') as f:
+                self.signers[cache_key] = IntersightSigner(options['api_key_id'], f.read())
+        return self.signers[cache_key]
+
+    def get_transport(self, options):
+        '''
+        Return a transport (and its connection pool) shared by all requests with the same connection settings
+        '''
+        transport = options['api_transport']
+        if transport == 'fetch_url':
+            # fetch_url opens a connection for each request, so use a pooled transport instead
+            if HAS_URLLIB3:
+                transport = 'urllib3'
+            elif HAS_HTTPX:
+                transport = 'httpx'
+            else:
+                raise ConnectionError('urllib3 or httpx is required for the intersight httpapi connection')
+        # the proxy (or proxy bypass) used by a transport depends on the api_uri host
+        cache_key = (transport, options['api_uri'], options['validate_certs'], options['use_proxy'], options['api_timeout'])
+        if cache_key not in self.transports:
+            self.transports[cache_key] = TRANSPORTS[transport](ConnectionModule(options))
+        return self.transports[cache_key]
+
+    def send_request(self, data, **message_kwargs):
+        '''
+        Sign and send an API request (see intersight_request)
+        '''
+        return self.intersight_request(message_kwargs['options'], message_kwargs['method'], message_kwargs['target_url'],
+                                       message_kwargs['request_target'], data)
+
+    def intersight_request(self, options, method, target_url, request_target, body_string):
+        '''
+        Sign and send an API request for a module
+
+        :param options: module options used to sign and send the request
+        :param method: http method
+        :param target_url: full URL of the request
+        :param request_target: http method plus endpoint used in the signature
+        :param body_string: request body
+        :return: tuple of the response info dict and the decoded response body
+        '''
+        request_header = self.get_signer(options).get_request_header(request_target, urlparse(target_url).netloc, body_string)
+        if options['use_compression']:
+            request_header['Accept-Encoding'] = 'gzip, deflate'
+
+        response, info = self.get_transport(options).request(method, target_url, body_string, request_header)
+
+        content_encoding = info.pop('content-encoding', None)
+        if isinstance(info.get('body'), bytes):
+            info['body'] = to_text(read_response(BytesIO(info['body']), content_encoding))
+        data = b''
+        if response is not None and str(info['status']).startswith('2'):
+            data = read_response(response, content_encoding)
+        if method != 'GET':
+            # objects may have been renamed or deleted
+            self.moid_cache.clear()
+
+        # only return values that can be serialized for the module
+        info = dict((key, value) for key, value in info.items() if value is None or isinstance(value, string_types + integer_types))
+        return info, to_text(data)
+
+    def get_results(self, options, api_uri, resource_path, query_params):
+        '''
+        GET the Results of a query for a module, raising a ConnectionError for an unsuccessful status
+        '''
+        query_path = '?' + urlencode(query_params).replace('+', '%20')
+        request_target = 'GET ' + urlparse(api_uri).path + resource_path + query_path
+        info, data = self.intersight_request(options, 'GET', api_uri + resource_path + query_path, request_target, '')
+        if not str(info['status']).startswith('2'):
+            raise ConnectionError('API error: %s %s %s' % (info['status'], info.get('msg'), info.get('body')))
+        return json.loads(data).get('Results') or []
+
+    def get_moid_by_name(self, options, api_uri, resource_path, target_name):
+        '''
+        Retrieve an Intersight object moid by name, caching the result for later tasks
+        '''
+        # accounts on intersight.com share the api_uri, so the cache is also keyed on the API key
+        cache_key = (api_uri, options['api_key_id'], resource_path, target_name)
+        if cache_key not in self.moid_cache:
+            results = self.get_results(options, api_uri, resource_path, {'$filter': "Name eq '{0}'".format(target_name)})
+            if not results:
+                raise ConnectionError('Intersight object with name "{0}" not found!'.format(target_name))
+            self.moid_cache[cache_key] = results[0]['Moid']
+        return self.moid_cache[cache_key]
+
+    def get_moids_by_name(self, options, api_uri, resource_path, names, batch_size=100):
+        '''
+        Retrieve the moids of several objects by name with batched "in" queries, caching the results for later tasks
+
+        :return: dict of the moid of each name that was found
+        '''
+        cache_prefix = (api_uri, options['api_key_id'], resource_path)
+        uncached = [name for name in names if cache_prefix + (name,) not in self.moid_cache]
+        for batch in chunks(uncached, batch_size):
+            query_params = {'$filter': get_in_filter('Name', batch), '$select': 'Name', '$top': batch_size}
+            for result in self.get_results(options, api_uri, resource_path, query_params):
+                self.moid_cache[cache_prefix + (result['Name'],)] = result['Moid']
+        return dict((name, self.moid_cache[cache_prefix + (name,)]) for name in names if cache_prefix + (name,) in self.moid_cache)
@@ -0,0 +1,12 @@
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# The modules import ansible.module_utils.remote_management.intersight, so the tests need an Ansible install
+# that includes this repo's module_utils (e.g., module_utils/remote_management/intersight.py linked into it).
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'library'))
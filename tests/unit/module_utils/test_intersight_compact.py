@@ -0,0 +1,118 @@
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# Memory benchmark for compact_results: synthetic compute.PhysicalSummary objects are decoded from JSON and held as
+# plain dicts or as compact records, and the memory of each is measured with tracemalloc.
+# Run with -s to see the benchmark results.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import json
+import time
+
+import pytest
+
+from ansible.module_utils.remote_management.intersight import COMPACT_DROP_FIELDS, compact_value, expand_value
+
+tracemalloc = pytest.importorskip('tracemalloc')
+
+OBJECTS = 5000
+
+
+def reference(object_type, index):
+    return {'ClassId': 'mo.MoRef', 'Moid': '%024x' % index, 'ObjectType': object_type,
+            'link': 'https://www.intersight.com/api/v1/%s/%024x' % (object_type.replace('.', '/'), index)}
+
+
+def physical_summary(index):
+    return {
+        'AccountMoid': '596cc79e5d91b400010d15ad',
+        'Ancestors': [reference('equipment.Chassis', index // 8), reference('network.Element', index // 160)],
+        'ClassId': 'compute.PhysicalSummary',
+        'CreateTime': '2019-08-12T18:52:17.562Z',
+        'DomainGroupMoid': '5b2541717a7662743465d09e',
+        'ModTime': '2019-10-%02dT%02d:%02d:%02d.%03dZ' % (1 + index % 28, index % 24, index % 60, index % 59, index % 1000),
+        'Moid': '%024x' % (0x5978bea36ad4b000018d0000 + index),
+        'ObjectType': 'compute.PhysicalSummary',
+        'Owners': ['596cc79e5d91b400010d15ad', '5b2541717a7662743465d09e'],
+        'PermissionResources': [reference('organization.Organization', 1)],
+        'SharedScope': '',
+        'AdminPowerState': 'policy',
+        'AlarmSummary': {'ClassId': 'compute.AlarmSummary', 'ObjectType': 'compute.AlarmSummary',
+                         'Critical': index % 3, 'Warning': index % 5, 'Health': 'Critical' if index % 3 else 'Healthy'},
+        'AvailableMemory': 393216,
+        'ChassisId': str(index // 8 + 1),
+        'ConnectionStatus': 'Connected',
+        'CpuCapacity': 88.0,
+        'Dn': 'sys/chassis-%d/blade-%d' % (index // 8 + 1, index % 8 + 1),
+        'Firmware': '4.0(4e)',
+        'Ipv4Address': '10.%d.%d.%d' % (index // 65536, index // 256 % 256, index % 256),
+        'ManagementMode': 'UCSM',
+        'MgmtIpAddress': '10.193.%d.%d' % (index // 256 % 256, index % 256),
+        'Model': ['UCSB-B200-M5', 'UCSB-B200-M4', 'UCSC-C220-M5SX'][index % 3],
+        'Name': 'SJC07-R14-FI-%d-%d' % (index // 8 + 1, index % 8 + 1),
+        'NumAdaptors': 1,
+        'NumCpuCores': 44,
+        'NumCpus': 2,
+        'NumEthHostInterfaces': 4,
+        'NumFcHostInterfaces': 2,
+        'NumThreads': 88,
+        'OperPowerState': 'on',
+        'OperState': 'ok',
+        'Platform': 'UCSFI',
+        'PlatformType': 'UCSFI',
+        'Presence': 'equipped',
+        'RegisteredDevice': reference('asset.DeviceRegistration', index // 160),
+        'Serial': 'FCH%08d' % index,
+        'ServerId': index % 8 + 1,
+        'SlotId': index % 8 + 1,
+        'SourceObjectType': 'compute.Blade',
+        'Tags': [{'Key': 'Site', 'Value': 'SJC07'}],
+        'TotalMemory': 393216,
+        'UserLabel': '',
+        'Uuid': '%08x-0000-0000-0000-%012x' % (index, index),
+        'Vendor': 'Cisco Systems Inc',
+    }
+
+
+def without_dropped_fields(value):
+    if isinstance(value, dict):
+        return dict((key, without_dropped_fields(item)) for (key, item) in value.items() if key not in COMPACT_DROP_FIELDS)
+    if isinstance(value, list):
+        return [without_dropped_fields(item) for item in value]
+    return value
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.time()
+    try:
+        value = func()
+        elapsed = time.time() - start
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return value, size, elapsed
+
+
+def test_round_trip():
+    obj = physical_summary(12)
+    assert expand_value(compact_value(obj)) == without_dropped_fields(obj)
+
+
+def test_memory_benchmark():
+    data = json.dumps({'Results': [physical_summary(index) for index in range(OBJECTS)]})
+
+    plain, plain_size, load_time = measure(lambda: json.loads(data)['Results'])
+    del plain
+    compact, compact_size, compact_time = measure(lambda: [compact_value(obj) for obj in json.loads(data)['Results']])
+    expanded, dummy, expand_time = measure(lambda: expand_value(compact))
+
+    print('\n%d objects (%.1f MB of JSON)' % (OBJECTS, len(data) / 1e6))
+    print('plain dicts: %.1f MB, json.loads %.2fs' % (plain_size / 1e6, load_time))
+    print('compact records: %.1f MB (%.0f%% less), json.loads and compact %.2fs' % (
+        compact_size / 1e6, 100.0 * (plain_size - compact_size) / plain_size, compact_time))
+    print('expand to dicts: %.2fs' % expand_time)
+
+    assert expanded[7] == without_dropped_fields(physical_summary(7))
+    assert compact_size < plain_size / 2
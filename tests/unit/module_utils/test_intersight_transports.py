@@ -0,0 +1,187 @@
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# Conformance tests run against each api_transport with a local HTTP server.  Every transport must return the
+# (response, info) pair that fetch_url returns, since IntersightModule.api_request handles them all the same way.
+# Run with -s to see the benchmark timings.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import gzip
+import json
+import tempfile
+import threading
+import time
+
+import pytest
+
+from ansible.module_utils.remote_management.intersight import TRANSPORTS, HAS_URLLIB3, HAS_HTTPX, read_response
+from ansible.module_utils.six import BytesIO
+from ansible.module_utils.six.moves import BaseHTTPServer, socketserver
+
+RESULTS = {'Results': [{'Moid': '5978bea36ad4b000018d63dc', 'Name': 'SJC07-R14-FI-1-1-1'}]}
+ERROR = {'code': 'InvalidRequest', 'message': 'Invalid filter'}
+SLOW_SECONDS = 3
+
+
+def gzip_bytes(data):
+    buf = BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which otherwise adds a delayed ACK to every request
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        headers = dict(headers or {})
+        if headers.get('Content-Encoding') == 'gzip':
+            body = gzip_bytes(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        if self.path == '/ok':
+            self.send_body(200, RESULTS, {'x-starship-traceid': 'trace-1'})
+        elif self.path == '/echo':
+            self.send_body(200, dict(method=self.command, body=body, authorization=self.headers.get('Authorization')))
+        elif self.path == '/gzip':
+            self.send_body(200, RESULTS, {'Content-Encoding': 'gzip'})
+        elif self.path == '/error':
+            self.send_body(400, ERROR)
+        elif self.path == '/gzip-error':
+            self.send_body(404, ERROR, {'Content-Encoding': 'gzip'})
+        elif self.path == '/slow':
+            time.sleep(SLOW_SECONDS)
+            self.send_body(200, RESULTS)
+        else:
+            self.send_body(404, ERROR)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = handle_request
+
+
+class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients of /slow time out and close the connection before the response is written
+        pass
+
+
+class FakeModule:
+    '''
+    The module attributes used by the transports (and by fetch_url)
+    '''
+
+    def __init__(self, transport, api_uri, api_timeout=10):
+        self.params = dict(
+            api_uri=api_uri,
+            validate_certs=True,
+            use_proxy=False,
+            use_compression=True,
+            api_transport=transport,
+            api_timeout=api_timeout,
+        )
+        self.tmpdir = tempfile.gettempdir()
+
+    def fail_json(self, **kwargs):
+        raise AssertionError(kwargs['msg'])
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def transport_params():
+    params = []
+    for name in sorted(TRANSPORTS):
+        missing = (name == 'urllib3' and not HAS_URLLIB3) or (name == 'httpx' and not HAS_HTTPX)
+        params.append(pytest.param(name, marks=pytest.mark.skipif(missing, reason='%s is not installed' % name)))
+    return params
+
+
+@pytest.fixture(params=transport_params())
+def transport(request, base_url):
+    return TRANSPORTS[request.param](FakeModule(request.param, base_url + '/api/v1'))
+
+
+def test_success(transport, base_url):
+    response, info = transport.request('GET', base_url + '/ok', '', {})
+    assert info['status'] == 200
+    assert info['url'] == base_url + '/ok'
+    assert info['x-starship-traceid'] == 'trace-1'
+    assert json.loads(read_response(response, info.get('content-encoding'))) == RESULTS
+
+
+def test_method_body_and_headers_sent(transport, base_url):
+    for method in ('POST', 'PATCH', 'DELETE'):
+        response, info = transport.request(method, base_url + '/echo', '{"Name": "test"}', {'Authorization': 'Signature x'})
+        assert info['status'] == 200
+        assert json.loads(read_response(response, info.get('content-encoding'))) == dict(
+            method=method, body='{"Name": "test"}', authorization='Signature x')
+
+
+def test_content_encoding_passthrough(transport, base_url):
+    response, info = transport.request('GET', base_url + '/gzip', '', {'Accept-Encoding': 'gzip'})
+    assert info['status'] == 200
+    assert info['content-encoding'] == 'gzip'
+    assert json.loads(read_response(response, info['content-encoding'])) == RESULTS
+
+
+@pytest.mark.parametrize('path', ['/error', '/gzip-error'])
+def test_error_body(transport, base_url, path):
+    response, info = transport.request('GET', base_url + path, '', {'Accept-Encoding': 'gzip'})
+    assert info['status'] in (400, 404)
+    assert info['msg']
+    assert isinstance(info['body'], bytes)
+    assert json.loads(read_response(BytesIO(info['body']), info.get('content-encoding'))) == ERROR
+
+
+def test_connection_refused(transport):
+    response, info = transport.request('GET', 'http://127.0.0.1:1/ok', '', {})
+    assert info['status'] == -1
+    assert info['msg']
+
+
+def test_timeout(base_url):
+    for name in sorted(TRANSPORTS):
+        if (name == 'urllib3' and not HAS_URLLIB3) or (name == 'httpx' and not HAS_HTTPX):
+            continue
+        transport = TRANSPORTS[name](FakeModule(name, base_url + '/api/v1', api_timeout=1))
+        start = time.time()
+        response, info = transport.request('GET', base_url + '/slow', '', {})
+        assert info['status'] == -1, name
+        assert info['msg'], name
+        assert time.time() - start < SLOW_SECONDS, name
+
+
+def test_benchmark(transport, base_url):
+    requests = 100
+    start = time.time()
+    for dummy in range(requests):
+        response, info = transport.request('GET', base_url + '/gzip', '', {'Accept-Encoding': 'gzip'})
+        assert info['status'] == 200
+        read_response(response, info['content-encoding'])
+    elapsed = time.time() - start
+    print('\n%s: %d requests in %.2fs (%.0f requests/s)' % (type(transport).__name__, requests, elapsed, requests / elapsed))
@@ -0,0 +1,227 @@
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# get_summary is run through a real IntersightModule against a local HTTP server that implements the $filter,
+# $count, and $apply=groupby(...,aggregate($count as count)) subset of the Intersight API used by the module.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import json
+import re
+import tempfile
+import threading
+
+import pytest
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from ansible.module_utils.remote_management.intersight import IntersightModule
+from ansible.module_utils.six.moves import BaseHTTPServer, socketserver
+from ansible.module_utils.six.moves.urllib.parse import urlparse, parse_qs
+
+import intersight_facts
+
+SERVERS = [
+    {'Moid': '5978bea36ad4b000018d63d1', 'Name': 'server-1', 'Model': 'UCSB-B200-M5', 'AlarmSummary': {'Health': 'Critical'}},
+    {'Moid': '5978bea36ad4b000018d63d2', 'Name': 'server-2', 'Model': 'UCSB-B200-M5', 'AlarmSummary': {'Health': 'Critical'}},
+    {'Moid': '5978bea36ad4b000018d63d3', 'Name': 'server-3', 'Model': 'UCSB-B200-M5', 'AlarmSummary': {'Health': 'Healthy'}},
+    {'Moid': '5978bea36ad4b000018d63d4', 'Name': 'server-4', 'Model': 'UCSC-C220-M5SX', 'AlarmSummary': {'Health': 'Healthy'}},
+    {'Moid': '5978bea36ad4b000018d63d5', 'Name': 'server-5', 'Model': 'UCSB-B200-M4'},
+]
+GROUPBY = re.compile(r'^groupby\(\(([A-Za-z]+(?:/[A-Za-z]+)*(?:,[A-Za-z]+(?:/[A-Za-z]+)*)*)\),aggregate\(\$count as count\)\)$')
+NAME_FILTER = re.compile(r"^Name eq '([^']*)'$")
+
+
+def get_path(server, path):
+    value = server
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def set_path(row, path, value):
+    for key in path[:-1]:
+        row = row.setdefault(key, {})
+    row[path[-1]] = value
+
+
+def filter_servers(query_filter):
+    if not query_filter:
+        return SERVERS
+    names = []
+    for term in query_filter.split(' or '):
+        match = NAME_FILTER.match(term)
+        if not match:
+            raise ValueError('Unsupported $filter: %s' % query_filter)
+        names.append(match.group(1))
+    return [server for server in SERVERS if server['Name'] in names]
+
+
+def groupby(servers, apply):
+    match = GROUPBY.match(apply)
+    if not match:
+        raise ValueError('Invalid $apply: %s' % apply)
+    paths = [tuple(field.split('/')) for field in match.group(1).split(',')]
+    counts = {}
+    for server in servers:
+        key = tuple(get_path(server, path) for path in paths)
+        counts[key] = counts.get(key, 0) + 1
+    rows = []
+    for key, count in counts.items():
+        row = {}
+        for path, value in zip(paths, key):
+            set_path(row, path, value)
+        row['count'] = count
+        rows.append(row)
+    return rows
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.requests.append(url.query)
+        if not (self.headers.get('Authorization') or '').startswith('Signature '):
+            return self.send_body(401, {'code': 'Unauthorized', 'message': 'Missing signature'})
+        if url.path != '/api/v1/compute/PhysicalSummaries':
+            return self.send_body(404, {'code': 'NotFound', 'message': url.path})
+        if '+' in url.query:
+            # spaces must be sent as %20
+            return self.send_body(400, {'code': 'InvalidRequest', 'message': 'Invalid query %s' % url.query})
+        params = dict((key, values[0]) for (key, values) in parse_qs(url.query).items())
+        try:
+            servers = filter_servers(params.get('$filter'))
+            if '$apply' in params:
+                return self.send_body(200, {'Results': groupby(servers, params['$apply'])})
+        except ValueError as e:
+            return self.send_body(400, {'code': 'InvalidRequest', 'message': str(e)})
+        result = {'Results': servers}
+        if params.get('$count') == 'true':
+            result = {'Count': len(servers)}
+        self.send_body(200, result)
+
+
+class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class FakeModule:
+    '''
+    The module attributes used by IntersightModule, fetch_url, and get_summary
+    '''
+
+    def __init__(self, api_uri, private_key, **params):
+        self.params = dict(
+            api_uri=api_uri,
+            api_key_id='596cc79e5d91b400010d15ad/596cc7945d91b400010d154e/5b6275df3437357030a7795f',
+            api_private_key=private_key,
+            validate_certs=True,
+            use_proxy=False,
+            use_compression=True,
+            compact_json=False,
+            api_transport='fetch_url',
+            api_timeout=10,
+            server_names=[],
+            summary_by=[],
+        )
+        self.params.update(params)
+        self.tmpdir = tempfile.gettempdir()
+
+    def fail_json(self, **kwargs):
+        raise AssertionError(kwargs['msg'])
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = Server(('127.0.0.1', 0), Handler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='module')
+def private_key(tmpdir_factory):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    path = tmpdir_factory.mktemp('keys').join('SecretKey.txt')
+    path.write_binary(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                        serialization.NoEncryption()))
+    return str(path)
+
+
+def get_summary(server, private_key, **params):
+    module = FakeModule('http://127.0.0.1:%d/api/v1' % server.server_address[1], private_key, **params)
+    del server.requests[:]
+    return intersight_facts.get_summary(module, IntersightModule(module))
+
+
+def test_total_count_only(server, private_key):
+    summary = get_summary(server, private_key)
+    assert summary == dict(count=5, groups={})
+    assert server.requests == ['%24count=true']
+
+
+def test_groupby_single_field(server, private_key):
+    summary = get_summary(server, private_key, summary_by=['Model'])
+    assert summary == dict(count=5, groups={
+        'Model': [
+            {'Model': 'UCSB-B200-M5', 'count': 3},
+            {'Model': 'UCSC-C220-M5SX', 'count': 1},
+            {'Model': 'UCSB-B200-M4', 'count': 1},
+        ],
+    })
+
+
+def test_groupby_dotted_paths(server, private_key):
+    summary = get_summary(server, private_key, summary_by=['Model, AlarmSummary.Health'])
+    assert summary['groups']['Model, AlarmSummary.Health'] == [
+        {'Model': 'UCSB-B200-M5', 'AlarmSummary.Health': 'Critical', 'count': 2},
+        {'Model': 'UCSB-B200-M5', 'AlarmSummary.Health': 'Healthy', 'count': 1},
+        {'Model': 'UCSC-C220-M5SX', 'AlarmSummary.Health': 'Healthy', 'count': 1},
+        {'Model': 'UCSB-B200-M4', 'AlarmSummary.Health': None, 'count': 1},
+    ]
+    apply = [query for query in server.requests if 'apply' in query]
+    assert apply == ['%24apply=groupby%28%28Model%2CAlarmSummary%2FHealth%29%2Caggregate%28%24count%20as%20count%29%29']
+
+
+def test_server_names_filter_every_query(server, private_key):
+    summary = get_summary(server, private_key, server_names=['server-1', 'server-4'], summary_by=['AlarmSummary.Health'])
+    assert summary['count'] == 2
+    assert sorted(summary['groups']['AlarmSummary.Health'], key=lambda row: row['AlarmSummary.Health']) == [
+        {'AlarmSummary.Health': 'Critical', 'count': 1},
+        {'AlarmSummary.Health': 'Healthy', 'count': 1},
+    ]
+    assert len(server.requests) == 2
+    for query in server.requests:
+        assert '%24filter=Name%20eq%20%27server-1%27%20or%20Name%20eq%20%27server-4%27' in query
+
+
+def test_api_error_fails_module(server, private_key):
+    with pytest.raises(AssertionError, match='API error'):
+        get_summary(server, private_key, summary_by=['Model,'])
+
+
+def test_get_field():
+    server = {'Model': 'UCSB-B200-M5', 'AlarmSummary': {'Health': 'Healthy'}, 'Firmware': None}
+    assert intersight_facts.get_field(server, 'Model') == 'UCSB-B200-M5'
+    assert intersight_facts.get_field(server, 'AlarmSummary.Health') == 'Healthy'
+    assert intersight_facts.get_field(server, 'AlarmSummary.Critical') is None
+    assert intersight_facts.get_field(server, 'Firmware.Version') is None